@@ -1,9 +1,45 @@
+import io
 import asyncio
 import os
+import json
+import time
 import random
+import sqlite3
+import hashlib
+import librosa
+import soundfile as sf
 from edge_tts import Communicate, list_voices
 from datetime import datetime
 
+# 自适应并发控制参数(AIMD：请求健康时加性增加并发，失败或超时时乘性减少)
+INITIAL_CONCURRENCY = 2  # 初始并发请求数
+MIN_CONCURRENCY = 1  # 并发下限
+MAX_CONCURRENCY = 16  # 并发上限
+CONCURRENCY_INCREASE = 1.0  # 每完成约一轮(当前并发数个)成功请求后增加的并发数
+CONCURRENCY_DECREASE_FACTOR = 0.5  # 失败、超时或延迟过高时并发数乘以该系数
+LATENCY_TARGET_SEC = 8.0  # 单个请求耗时超过该值视为服务拥塞
+REQUEST_TIMEOUT_SEC = 30  # 单个请求超时时间(秒)，超时按失败处理
+RETRY_DELAY_SEC = 2  # 失败后重试前的等待时间(秒)
+LIMITER_LOG_SECONDS = 30  # 输出当前并发上限和实际请求速率的间隔(秒)
+
+# 批量生成参数
+WORKER_COUNT = MAX_CONCURRENCY  # 工作协程数量，实际并发请求数由AdaptiveLimiter控制
+PROGRESS_LOG_SECONDS = 30  # 输出生成进度的间隔(秒)
+MANIFEST_FILENAME = "manifest.jsonl"  # 输出目录中的生成清单，每完成一个任务追加一行
+
+# 变体参数与合成缓存
+RATE_CHANGE_RANGE = (5, 15)  # Fast/Slow变体的语速变化范围(百分比，含两端)
+VOLUME_CHANGE_RANGE = (0, 5)  # 变体的音量增加范围(百分比，含两端)
+SYNTH_CACHE_ENABLED = True  # 是否启用合成结果缓存(按文本、声音、语速、音量寻址)
+SYNTH_CACHE_PATH = None  # 缓存数据库路径，None表示使用输出目录下的synthesis_cache.sqlite
+SYNTH_CACHE_MAX_MB = 2048  # 缓存音频总大小上限(MB)，超出后按最近最少使用淘汰
+
+# 输出音频格式(服务返回24kHz单声道MP3，在内存中解码并重采样后直接写出WAV，无需再运行wav_resample.py)
+OUTPUT_SAMPLE_RATE = 16000  # 输出WAV的采样率
+OUTPUT_SUBTYPE = "PCM_16"  # 输出WAV的采样格式(16位整数)
+TRIM_TO_SPEECH = True  # 按WordBoundary事件把音频裁剪到说话区间，去掉服务附带的首尾静音
+TRIM_MARGIN_MS = 150  # 裁剪时在首词之前和末词之后保留的时长(毫秒)
+
 instructions = [
     "Hey Memo",
     "Next",
@@ -351,38 +387,290 @@ VOICE_PROFILES = [
 ]
 
 
+class AdaptiveLimiter:
+    """AIMD自适应并发控制器
+
+    每个成功且耗时未超过LATENCY_TARGET_SEC的请求使并发上限增加 CONCURRENCY_INCREASE/上限，
+    即每完成一轮请求约增加CONCURRENCY_INCREASE；失败、超时或延迟过高时上限乘以CONCURRENCY_DECREASE_FACTOR。
+    同一次拥塞期间已发出的请求随后相继失败时只减少一次，避免上限被连续压到下限。
+    """
+
+    def __init__(self, initial=INITIAL_CONCURRENCY, minimum=MIN_CONCURRENCY, maximum=MAX_CONCURRENCY):
+        self.minimum = minimum
+        self.maximum = maximum
+        self.limit = float(min(max(initial, minimum), maximum))
+        self.in_flight = 0
+        self.condition = asyncio.Condition()
+        self.last_decrease = 0.0
+        # 统计信息
+        self.started_at = time.monotonic()
+        self.completed = 0
+        self.failed = 0
+        self.window_start = self.started_at
+        self.window_completed = 0
+        self.window_failed = 0
+        self.window_latency = 0.0
+        self.peak_limit = int(self.limit)
+
+    async def acquire(self):
+        """等待直到正在进行的请求数低于当前并发上限，返回请求开始时间"""
+        async with self.condition:
+            while self.in_flight >= int(self.limit):
+                await self.condition.wait()
+            self.in_flight += 1
+        return time.monotonic()
+
+    async def release(self, started, success):
+        """请求结束，按结果和耗时调整并发上限"""
+        now = time.monotonic()
+        latency = now - started
+        async with self.condition:
+            self.in_flight -= 1
+            self.window_latency += latency
+            if success:
+                self.completed += 1
+                self.window_completed += 1
+            else:
+                self.failed += 1
+                self.window_failed += 1
+
+            if success and latency <= LATENCY_TARGET_SEC:
+                self.limit = min(self.maximum, self.limit + CONCURRENCY_INCREASE / self.limit)
+            elif started >= self.last_decrease:
+                # 只有在上次减少之后发出的请求才能再次触发减少
+                self.limit = max(self.minimum, self.limit * CONCURRENCY_DECREASE_FACTOR)
+                self.last_decrease = now
+                reason = "延迟过高" if success else "请求失败"
+                print(f"{reason}({latency:.1f}秒)，并发上限降为 {int(self.limit)}")
+            self.peak_limit = max(self.peak_limit, int(self.limit))
+            self.condition.notify_all()
+
+        if now - self.window_start >= LIMITER_LOG_SECONDS:
+            self.log_status(now)
+
+    def log_status(self, now=None):
+        """输出当前并发上限、实际请求速率、失败率和平均耗时，并开始新的统计窗口"""
+        now = now or time.monotonic()
+        elapsed = max(now - self.window_start, 1e-9)
+        finished = self.window_completed + self.window_failed
+        rate = finished / elapsed
+        error_rate = self.window_failed / finished if finished else 0.0
+        mean_latency = self.window_latency / finished if finished else 0.0
+        print(f"并发上限: {int(self.limit)}, 进行中: {self.in_flight}, 请求速率: {rate:.2f} 次/秒, "
+              f"失败率: {error_rate * 100:.1f}%, 平均耗时: {mean_latency:.2f} 秒")
+        self.window_start = now
+        self.window_completed = 0
+        self.window_failed = 0
+        self.window_latency = 0.0
+
+    def summary(self):
+        """返回整个批次的请求统计"""
+        elapsed = max(time.monotonic() - self.started_at, 1e-9)
+        return {
+            "completed": self.completed,
+            "failed": self.failed,
+            "requests_per_second": round((self.completed + self.failed) / elapsed, 3),
+            "final_limit": int(self.limit),
+            "peak_limit": self.peak_limit
+        }
+
+    async def run(self, make_coroutine):
+        """在并发上限内执行一个请求(超时按失败处理)，并根据结果调整上限"""
+        started = await self.acquire()
+        try:
+            result = await asyncio.wait_for(make_coroutine(), REQUEST_TIMEOUT_SEC)
+        except BaseException:
+            await self.release(started, False)
+            raise
+        await self.release(started, True)
+        return result
+
+
+class SynthesisCache:
+    """基于SQLite的合成结果缓存
+
+    以(文本, 声音, 语速, 音量)为键保存服务返回的音频和词边界，同一运行内和跨运行的重复请求都直接从本地读取。
+    音频总大小超过上限时按最近使用时间淘汰。同一个键的请求正在进行时，后来的请求等待其结果而不重复请求。
+    """
+
+    def __init__(self, db_path, max_bytes=None):
+        """打开(或创建)缓存数据库"""
+        self.db_path = db_path
+        self.max_bytes = max_bytes or SYNTH_CACHE_MAX_MB * 1024 ** 2
+        self.hits = 0
+        self.misses = 0
+        self.pending = {}
+
+        self._conn = sqlite3.connect(db_path, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS synthesis_cache ("
+            "key TEXT PRIMARY KEY, audio BLOB, size INTEGER, last_used REAL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_synthesis_cache_last_used ON synthesis_cache(last_used)")
+
+        # 旧版本的缓存没有词边界列，补充该列（旧条目的词边界为NULL，写出时不裁剪）
+        columns = [row[1] for row in self._conn.execute("PRAGMA table_info(synthesis_cache)")]
+        if "words" not in columns:
+            self._conn.execute("ALTER TABLE synthesis_cache ADD COLUMN words TEXT")
+        self._conn.commit()
+        self._bytes = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM synthesis_cache").fetchone()[0]
+
+    @staticmethod
+    def make_key(text, voice, rate, volume):
+        """计算缓存键：文本 + 声音 + 语速 + 音量"""
+        return hashlib.sha256(f"{text}|{voice}|{rate}|{volume}".encode()).hexdigest()
+
+    def get(self, key):
+        """查询缓存，命中时刷新最近使用时间，返回{"audio", "words"}"""
+        row = self._conn.execute("SELECT audio, words FROM synthesis_cache WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        self._conn.execute("UPDATE synthesis_cache SET last_used = ? WHERE key = ?", (time.time(), key))
+        self._conn.commit()
+        return {"audio": row[0], "words": json.loads(row[1]) if row[1] is not None else None}
+
+    def put(self, key, result):
+        """写入合成音频和词边界，必要时淘汰最久未使用的条目"""
+        audio = result["audio"]
+        old = self._conn.execute("SELECT size FROM synthesis_cache WHERE key = ?", (key,)).fetchone()
+        self._conn.execute(
+            "INSERT OR REPLACE INTO synthesis_cache (key, audio, words, size, last_used) VALUES (?, ?, ?, ?, ?)",
+            (key, audio, json.dumps(result["words"], ensure_ascii=False), len(audio), time.time())
+        )
+        self._bytes += len(audio) - (old[0] if old else 0)
+
+        while self._bytes > self.max_bytes:
+            rows = self._conn.execute(
+                "SELECT key, size FROM synthesis_cache WHERE key != ? ORDER BY last_used LIMIT 100", (key,)
+            ).fetchall()
+            if not rows:
+                break
+            for evicted, size in rows:
+                if self._bytes <= self.max_bytes:
+                    break
+                self._conn.execute("DELETE FROM synthesis_cache WHERE key = ?", (evicted,))
+                self._bytes -= size
+        self._conn.commit()
+
+    async def fetch(self, key, synthesize):
+        """返回(合成结果, 是否来自缓存)：先查缓存，未命中时调用synthesize()，同一键的并发请求共享一次合成"""
+        result = self.get(key)
+        if result is not None:
+            self.hits += 1
+            return result, True
+
+        if key in self.pending:
+            self.hits += 1
+            return await asyncio.shield(self.pending[key]), True
+
+        self.misses += 1
+        future = asyncio.get_running_loop().create_future()
+        self.pending[key] = future
+        try:
+            result = await synthesize()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # 等待者会收到同样的异常，没有等待者时避免未取回异常的警告
+            future.exception()
+            raise
+        else:
+            future.set_result(result)
+        finally:
+            del self.pending[key]
+        self.put(key, result)
+        return result, False
+
+    def stats(self):
+        """返回缓存命中统计"""
+        lookups = self.hits + self.misses
+        entries = self._conn.execute("SELECT COUNT(*) FROM synthesis_cache").fetchone()[0]
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0,
+            "entries": entries,
+            "size_mb": round(self._bytes / 1024 ** 2, 1)
+        }
+
+    def close(self):
+        self._conn.close()
+
+
+def write_wav(file_path, audio, words=None):
+    """把服务返回的MP3数据在内存中解码、下混并重采样为OUTPUT_SAMPLE_RATE，写出16位单声道WAV
+
+    有词边界且开启TRIM_TO_SPEECH时，只保留首词开始到末词结束(前后各留TRIM_MARGIN_MS)的部分。
+    返回写出音频的时长、裁掉的开头时长和相对于写出音频的词边界(毫秒)。
+    """
+    samples, _ = librosa.load(io.BytesIO(audio), sr=OUTPUT_SAMPLE_RATE, mono=True)
+    original_ms = len(samples) * 1000 / OUTPUT_SAMPLE_RATE
+
+    trim_start_ms = 0
+    if TRIM_TO_SPEECH and words:
+        trim_start_ms = max(0, words[0]["start_ms"] - TRIM_MARGIN_MS)
+        trim_end_ms = min(original_ms, words[-1]["end_ms"] + TRIM_MARGIN_MS)
+        if trim_end_ms > trim_start_ms:
+            samples = samples[int(trim_start_ms * OUTPUT_SAMPLE_RATE / 1000):
+                              int(trim_end_ms * OUTPUT_SAMPLE_RATE / 1000)]
+        else:
+            trim_start_ms = 0
+
+    sf.write(file_path, samples, OUTPUT_SAMPLE_RATE, subtype=OUTPUT_SUBTYPE)
+    shifted = [{"text": word["text"], "start_ms": word["start_ms"] - trim_start_ms,
+                "end_ms": word["end_ms"] - trim_start_ms} for word in words or []]
+    return {
+        "duration_ms": round(len(samples) * 1000 / OUTPUT_SAMPLE_RATE, 1),
+        "original_duration_ms": round(original_ms, 1),
+        "trim_start_ms": trim_start_ms,
+        "words": shifted
+    }
+
+
+def variation_choices(base_rate_type):
+    """列出一个语速类型下所有可能的(语速参数, 音量参数)组合，Normal速率不传递速率参数"""
+    if base_rate_type == "Normal":
+        rates = [None]
+    elif base_rate_type in ("Fast", "Slow"):
+        sign = "+" if base_rate_type == "Fast" else "-"
+        rates = [f"{sign}{rate}%" for rate in range(RATE_CHANGE_RANGE[0], RATE_CHANGE_RANGE[1] + 1)]
+    else:
+        raise ValueError(f"未知的语速类型: {base_rate_type}")
+    volumes = [f"+{volume}%" for volume in range(VOLUME_CHANGE_RANGE[0], VOLUME_CHANGE_RANGE[1] + 1)]
+    return [(rate, volume) for rate in rates for volume in volumes]
+
+
+def variation_params(text, voice_profile, base_rate_type, variation_id):
+    """为变体选择(语速参数, 音量参数)
+
+    同一声音、文本、语速类型下的组合按固定顺序打乱后依次分配，变体数不超过组合数时各变体参数互不相同，
+    超出后循环使用(重复的音频由缓存提供)。
+    """
+    choices = variation_choices(base_rate_type)
+    random.Random(f"{voice_profile['voice']}|{text}|{base_rate_type}").shuffle(choices)
+    return choices[(variation_id - 1) % len(choices)]
+
+
+def count_unique_variations(rate_types, variants_per_combo):
+    """每个(声音, 文本)组合实际不同的音频数量"""
+    return sum(min(variants_per_combo, len(variation_choices(rate_type))) for rate_type in rate_types)
+
+
 async def generate_speech_with_variation(text, voice_profile, output_dir, variation_id,
-                                         base_rate_type="Normal", base_volume="0"):
-    """生成带变化的语音文件"""
+                                         base_rate_type="Normal", base_volume="0", limiter=None, cache=None):
+    """生成带变化的语音文件，返回文件路径、实际参数、是否来自缓存和词边界，失败时返回None"""
     # 去除语句中的空格，用于文件名
     text_for_filename = text.replace(", ", "")
 
     # 对于每个变体，稍微调整语速和音量以创造差异
-    # 使用variation_id作为基础，增加轻微随机变化
-    random.seed(int(voice_profile['age']) + variation_id + len(text))
-
-    # 根据基础速率类型设置实际速率值
-    if base_rate_type == "Normal":
-        rate_folder_name = "Normal"
-        # Normal速率不传递速率参数
-        rate_param = None
-    elif base_rate_type == "Fast":
-        rate_folder_name = "Fast"
-        # 在8-12之间随机选择整数
-        actual_rate = random.randint(5, 15)
-        rate_param = f"+{actual_rate}%"
-    elif base_rate_type == "Slow":
-        rate_folder_name = "Slow"
-        # 在8-12之间随机选择整数，但是负值
-        actual_rate = random.randint(5, 15)
-        rate_param = f"-{actual_rate}%"
-
-    # 随机音量变化
-    actual_volume = random.randint(0, 5)
-    volume_param = f"+{actual_volume}%"
+    rate_param, volume_param = variation_params(text, voice_profile, base_rate_type, variation_id)
 
     # 构建文件夹名称
-    folder_name = f"{voice_profile['country']}_{voice_profile['city']}_{voice_profile['gender']}_{voice_profile['age']}_{rate_folder_name}"
+    folder_name = f"{voice_profile['country']}_{voice_profile['city']}_{voice_profile['gender']}_{voice_profile['age']}_{base_rate_type}"
     folder_path = os.path.join(output_dir, folder_name)
 
     # 确保文件夹存在
@@ -392,88 +680,170 @@ async def generate_speech_with_variation(text, voice_profile, output_dir, variat
     filename = f"{voice_profile['country']}_{voice_profile['city']}_{voice_profile['gender']}_{voice_profile['age']}_{text_for_filename}_var{variation_id}.wav"
     file_path = os.path.join(folder_path, filename)
 
+    # 根据是否有速率参数创建communicate对象，Normal速率不传递速率参数
+    communicate_kwargs = {"volume": volume_param}
+    if rate_param is not None:
+        communicate_kwargs["rate"] = rate_param
+
+    async def synthesize():
+        # 请求逐词边界事件，偏移和时长的单位为100纳秒
+        communicate = Communicate(text, voice_profile['voice'], boundary="WordBoundary", **communicate_kwargs)
+        audio = bytearray()
+        words = []
+        async for chunk in communicate.stream():
+            if chunk["type"] == "audio":
+                audio.extend(chunk["data"])
+            elif chunk["type"] == "WordBoundary":
+                words.append({"text": chunk["text"], "start_ms": round(chunk["offset"] / 10000, 1),
+                              "end_ms": round((chunk["offset"] + chunk["duration"]) / 10000, 1)})
+        if not audio:
+            raise RuntimeError("服务未返回音频")
+        return {"audio": bytes(audio), "words": words}
+
+    async def request():
+        # 单独调用时使用独立的控制器
+        request_limiter = limiter or AdaptiveLimiter(maximum=MAX_CONCURRENCY)
+        try:
+            return await request_limiter.run(synthesize)
+        except Exception as e:
+            print(f"生成失败: {e!r}")
+            # 添加延迟重试
+            await asyncio.sleep(RETRY_DELAY_SEC)
+            return await request_limiter.run(synthesize)
+
     try:
-        # 根据是否有速率参数创建communicate对象
-        if rate_param is None:
-            communicate = Communicate(
-                text,
-                voice_profile['voice'],
-                volume=volume_param
-            )
+        if cache is not None:
+            key = SynthesisCache.make_key(text, voice_profile['voice'], rate_param, volume_param)
+            synthesized, cached = await cache.fetch(key, request)
         else:
-            communicate = Communicate(
-                text,
-                voice_profile['voice'],
-                rate=rate_param,
-                volume=volume_param
-            )
-
-        await communicate.save(file_path)
-        return file_path
+            synthesized, cached = await request(), False
     except Exception as e:
-        print(f"生成失败: {e}")
-        # 添加延迟重试
-        await asyncio.sleep(2)
-        try:
-            if rate_param is None:
-                communicate = Communicate(
-                    text,
-                    voice_profile['voice'],
-                    volume=volume_param
-                )
-            else:
-                communicate = Communicate(
-                    text,
-                    voice_profile['voice'],
-                    rate=rate_param,
-                    volume=volume_param
-                )
-            await communicate.save(file_path)
-            return file_path
-        except Exception as e2:
-            print(f"重试失败: {e2}")
-            return None
+        print(f"重试失败: {e!r}")
+        return None
 
+    # 解码、裁剪和写出在线程中进行，不阻塞其他请求
+    try:
+        written = await asyncio.to_thread(write_wav, file_path, synthesized["audio"], synthesized["words"])
+    except Exception as e:
+        print(f"解码失败 {file_path}: {e!r}")
+        return None
+    return {"file": file_path, "rate": rate_param, "volume": volume_param, "cached": cached, **written}
 
-async def batch_generate_with_variations(instructions, voice_profiles, output_dir="generated_speech",
-                                         rate_types=["Normal", "Fast", "Slow"],
-                                         variants_per_combo=30):
-    """批量生成带变化的语音文件，为每个组合生成多个变体"""
-    # 创建输出目录
-    os.makedirs(output_dir, exist_ok=True)
-    # 存储生成的文件列表
-    generated_files = []
-    # 使用信号量控制并发数量，避免过多请求导致服务拒绝
-    semaphore = asyncio.Semaphore(2)  # 同时最多2个请求
-
-    async def limited_generate(text, profile, variation_id, rate_type):
-        async with semaphore:
-            return await generate_speech_with_variation(
-                text, profile, output_dir, variation_id, rate_type
-            )
-
-    # 创建所有任务
-    tasks = []
+
+def iter_work_items(instructions, voice_profiles, rate_types, variants_per_combo):
+    """按 说话人 × 语速 × 指令 × 变体 的顺序逐个产生任务，不预先生成全部任务"""
     for profile in voice_profiles:
         for rate_type in rate_types:
             for instruction in instructions:
                 # 为每个组合生成多个变体
                 for variant_id in range(1, variants_per_combo + 1):
-                    tasks.append(limited_generate(
-                        instruction, profile, variant_id, rate_type
-                    ))
-
-    # 执行所有任务，获取结果
-    results = await asyncio.gather(*tasks, return_exceptions=True)
-    # 处理结果
-    for result in results:
-        if isinstance(result, Exception):
-            print(f"错误: {result}")
-        elif result:
-            generated_files.append(result)
-            print(f"已生成: {result}")
-
-    return generated_files
+                    yield instruction, profile, variant_id, rate_type
+
+
+class ProgressReporter:
+    """随任务完成输出进度，并把每个任务的结果追加写入生成清单"""
+
+    def __init__(self, total, manifest_path):
+        self.total = total
+        self.done = 0
+        self.generated = 0
+        self.failed = 0
+        self.started_at = time.monotonic()
+        self.last_log = self.started_at
+        self.manifest = open(manifest_path, 'a', encoding='utf-8')
+
+    def record(self, text, profile, variation_id, rate_type, result, error=None):
+        """记录一个已完成的任务，result为generate_speech_with_variation的返回值"""
+        self.done += 1
+        if result:
+            self.generated += 1
+        else:
+            self.failed += 1
+        entry = {
+            "text": text,
+            "voice": profile['voice'],
+            "rate_type": rate_type,
+            "variation_id": variation_id,
+            "status": "ok" if result else "failed"
+        }
+        if result:
+            entry.update(result)
+        if error is not None:
+            entry["error"] = repr(error)
+        self.manifest.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+        now = time.monotonic()
+        if now - self.last_log >= PROGRESS_LOG_SECONDS or self.done == self.total:
+            self.manifest.flush()
+            self.log_progress(now)
+
+    def log_progress(self, now=None):
+        """输出已完成数量、速率和预计剩余时间"""
+        now = now or time.monotonic()
+        elapsed = max(now - self.started_at, 1e-9)
+        rate = self.done / elapsed
+        remaining = (self.total - self.done) / rate if rate else 0
+        print(f"进度: {self.done}/{self.total} ({self.done / max(self.total, 1) * 100:.1f}%), "
+              f"成功: {self.generated}, 失败: {self.failed}, 速率: {rate:.2f} 个/秒, "
+              f"预计剩余: {remaining / 60:.1f} 分钟")
+        self.last_log = now
+
+    def close(self):
+        self.manifest.close()
+
+
+async def batch_generate_with_variations(instructions, voice_profiles, output_dir="generated_speech",
+                                         rate_types=["Normal", "Fast", "Slow"],
+                                         variants_per_combo=30):
+    """批量生成带变化的语音文件，为每个组合生成多个变体
+
+    固定数量的工作协程从惰性任务生成器中逐个取任务，结果随完成写入生成清单，
+    内存占用与任务总数无关。返回生成统计。
+    """
+    # 创建输出目录
+    os.makedirs(output_dir, exist_ok=True)
+    # 自适应控制并发数量：服务健康时逐步提高，失败或超时时减半，避免过多请求导致服务拒绝
+    limiter = AdaptiveLimiter()
+    total = len(voice_profiles) * len(rate_types) * len(instructions) * variants_per_combo
+    work_items = iter_work_items(instructions, voice_profiles, rate_types, variants_per_combo)
+    progress = ProgressReporter(total, os.path.join(output_dir, MANIFEST_FILENAME))
+    cache = None
+    if SYNTH_CACHE_ENABLED:
+        cache = SynthesisCache(SYNTH_CACHE_PATH or os.path.join(output_dir, "synthesis_cache.sqlite"))
+    # 语速和音量的组合有限，变体数超过组合数的部分与已有变体音频相同
+    unique = len(voice_profiles) * len(instructions) * count_unique_variations(rate_types, variants_per_combo)
+    print(f"共 {total} 个生成任务，其中不重复的音频 {unique} 个，结果清单: {os.path.join(output_dir, MANIFEST_FILENAME)}")
+
+    async def worker():
+        # 协程在单线程中运行，next()之间不会被打断，多个工作协程可共享同一个生成器
+        for text, profile, variation_id, rate_type in work_items:
+            try:
+                result = await generate_speech_with_variation(
+                    text, profile, output_dir, variation_id, rate_type, limiter=limiter, cache=cache
+                )
+            except Exception as e:
+                print(f"错误: {e!r}")
+                progress.record(text, profile, variation_id, rate_type, None, error=e)
+            else:
+                progress.record(text, profile, variation_id, rate_type, result)
+
+    try:
+        await asyncio.gather(*(worker() for _ in range(min(WORKER_COUNT, max(total, 1)))))
+    finally:
+        progress.close()
+        cache_stats = cache.stats() if cache is not None else None
+        if cache is not None:
+            cache.close()
+
+    limiter.log_status()
+    stats = limiter.summary()
+    print(f"请求完成: {stats['completed']}, 失败: {stats['failed']}, 平均速率: {stats['requests_per_second']} 次/秒, "
+          f"最终并发上限: {stats['final_limit']}, 最高并发上限: {stats['peak_limit']}")
+    if cache_stats:
+        print(f"合成缓存: 命中 {cache_stats['hits']}, 未命中 {cache_stats['misses']} "
+              f"(命中率 {cache_stats['hit_rate'] * 100:.1f}%), 条目 {cache_stats['entries']}, {cache_stats['size_mb']} MB")
+    return {"total": total, "unique": unique, "generated": progress.generated, "failed": progress.failed,
+            "requests": stats, "cache": cache_stats}
 
 
 async def main_async():
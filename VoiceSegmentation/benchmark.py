@@ -0,0 +1,252 @@
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import numpy as np
+import soundfile as sf
+
+import segmentation
+from segmentation import Config, AudioSplitter
+
+
+# 合成录音参数
+SAMPLE_RATE = 16000  # 合成录音的采样率
+NOISE_FLOOR = 0.0005  # 背景噪声幅度(约-66dBFS)，低于静音阈值
+UTTERANCE_GAP_MS = (1000, 3000)  # 语句之间的静音时长范围(毫秒)，需大于MIN_SILENCE_LEN
+NOISE_BURST_RATE = 0.1  # 插入非关键词噪声片段(咳嗽、碰撞声等)的概率
+SPEAKERS = ["US_NY_M_20", "UK_LONDON_F_31", "CAN_TORONTO_M_45", "AU_SYDNEY_F_27"]  # 合成录音的文件名(说话人信息)
+
+
+def synthesize_syllable(rng, f0, formants, duration):
+    """合成一个浊音音节：基频带轻微下滑的谐波，按共振峰加权，汉宁窗包络"""
+    t = np.arange(int(SAMPLE_RATE * duration)) / SAMPLE_RATE
+    f = f0 * (1 + 0.05 * rng.standard_normal()) * (1 - 0.1 * t / duration)
+    phase = 2 * np.pi * np.cumsum(f) / SAMPLE_RATE
+    signal = np.zeros(len(t))
+    for k in range(1, 40):
+        weight = sum(np.exp(-((k * f0 - formant) / 150) ** 2) for formant in formants)
+        signal += weight * np.sin(k * phase)
+    return signal * np.hanning(len(t))
+
+
+def synthesize_keyword(rng, keyword_index, level):
+    """合成关键词语音：每个关键词有固定的音节数和共振峰，语速、音高和音量随机变化"""
+    pattern = np.random.default_rng(100 + keyword_index)
+    syllables = []
+    for _ in range(1 + keyword_index % 3):
+        formants = (pattern.uniform(300, 900), pattern.uniform(1000, 2500))
+        duration = pattern.uniform(0.15, 0.3) * rng.uniform(0.8, 1.2)
+        syllables.append(synthesize_syllable(rng, (110 + 20 * keyword_index) * rng.uniform(0.9, 1.1),
+                                             formants, duration))
+        # 音节之间的短暂停顿
+        syllables.append(np.zeros(int(SAMPLE_RATE * rng.uniform(0.02, 0.08))))
+    speech = np.concatenate(syllables[:-1])
+    return level * speech / max(np.abs(speech).max(), 1e-9)
+
+
+def synthesize_recording(path, duration_sec, seed):
+    """合成一段长录音并写出标注文件
+
+    标注文件 <录音>.transcript.json 同时是本地识别后端的输入和边界评估的真值，
+    非关键词噪声片段的text为空（识别为NoMatch）。录音逐段写入，内存占用与时长无关。
+    """
+    rng = np.random.default_rng(seed)
+    transcript = []
+    position = 0
+
+    with sf.SoundFile(path, 'w', samplerate=SAMPLE_RATE, channels=1, subtype='PCM_16') as f:
+        def write(signal):
+            nonlocal position
+            noise = NOISE_FLOOR * rng.standard_normal(len(signal))
+            f.write(np.clip(signal + noise, -1, 1))
+            position += len(signal)
+
+        while position < duration_sec * SAMPLE_RATE:
+            write(np.zeros(int(SAMPLE_RATE * rng.uniform(*UTTERANCE_GAP_MS) / 1000)))
+            start_ms = position * 1000 / SAMPLE_RATE
+
+            if rng.random() < NOISE_BURST_RATE:
+                burst = rng.standard_normal(int(SAMPLE_RATE * rng.uniform(0.1, 0.4)))
+                write(rng.uniform(0.05, 0.2) * burst * np.hanning(len(burst)))
+                text = ""
+            else:
+                keyword_index = int(rng.integers(len(Config.KEYWORDS)))
+                write(synthesize_keyword(rng, keyword_index, rng.uniform(0.05, 0.6)))
+                text = Config.KEYWORDS[keyword_index]
+
+            transcript.append({"start_ms": round(start_ms), "end_ms": round(position * 1000 / SAMPLE_RATE),
+                               "text": text})
+        write(np.zeros(SAMPLE_RATE * 2))
+
+    with open(f"{path}.transcript.json", 'w', encoding='utf-8') as f:
+        json.dump(transcript, f, ensure_ascii=False)
+    return position / SAMPLE_RATE, transcript
+
+
+def expected_boundaries(transcript, total_ms):
+    """按静音分割规则由真值语句区间推算片段边界（首尾各保留KEEP_SILENCE，相邻间隔不足时取中点）"""
+    keep = Config.KEEP_SILENCE
+    boundaries = []
+    for i, entry in enumerate(transcript):
+        start = entry["start_ms"] - keep
+        end = entry["end_ms"] + keep
+        if i > 0 and transcript[i - 1]["end_ms"] + keep > start:
+            start = (transcript[i - 1]["end_ms"] + entry["start_ms"]) // 2
+        if i + 1 < len(transcript) and transcript[i + 1]["start_ms"] - keep < end:
+            end = (entry["end_ms"] + transcript[i + 1]["start_ms"]) // 2
+        boundaries.extend((max(start, 0), min(end, total_ms)))
+    return boundaries
+
+
+def match_boundaries(detected, expected, tolerance_ms):
+    """按时间顺序贪心匹配边界，返回匹配数（每个边界最多匹配一次）"""
+    detected = sorted(detected)
+    expected = sorted(expected)
+    matched = 0
+    i = j = 0
+    while i < len(detected) and j < len(expected):
+        if abs(detected[i] - expected[j]) <= tolerance_ms:
+            matched += 1
+            i += 1
+            j += 1
+        elif detected[i] < expected[j]:
+            i += 1
+        else:
+            j += 1
+    return matched
+
+
+def expected_keyword(transcript, start_ms, end_ms):
+    """片段区间内的真值关键词（与片段重叠最多的语句），非关键词返回Unknown"""
+    best, best_overlap = None, 0
+    for entry in transcript:
+        overlap = min(entry["end_ms"], end_ms) - max(entry["start_ms"], start_ms)
+        if overlap > best_overlap:
+            best, best_overlap = entry, overlap
+    if best is None or not best["text"]:
+        return "Unknown"
+    return Config.KEYWORD_MAPPING.get(best["text"].lower(), best["text"])
+
+
+def peak_rss_mb():
+    """当前进程的峰值内存(MB)，平台不支持时返回None"""
+    try:
+        import resource
+    except ImportError:
+        try:
+            import psutil
+        except ImportError:
+            return None
+        return psutil.Process().memory_info().peak_wset / 1024 ** 2
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux单位为KB，macOS为字节
+    return peak / 1024 ** 2 if sys.platform == 'darwin' else peak / 1024
+
+
+def run_benchmark(work_dir, minutes, files, seed, tolerance_ms):
+    """合成录音、用本地识别后端完整运行分割流程并计算指标"""
+    input_folder = os.path.join(work_dir, "input")
+    output_folder = os.path.join(work_dir, "output")
+    shutil.rmtree(output_folder, ignore_errors=True)
+    os.makedirs(input_folder, exist_ok=True)
+
+    print(f"合成 {files} 段 {minutes} 分钟的录音...")
+    recordings = {}
+    for i in range(files):
+        path = os.path.join(input_folder, f"{SPEAKERS[i % len(SPEAKERS)]}{'' if i < len(SPEAKERS) else i}.wav")
+        duration, transcript = synthesize_recording(path, minutes * 60, seed + i)
+        recordings[path] = (duration, transcript)
+    audio_seconds = sum(duration for duration, _ in recordings.values())
+    rss_before = peak_rss_mb()
+
+    # 本地识别后端，不限速、无模拟延迟，只测量本地处理开销
+    Config.ASR_BACKEND = "local"
+    Config.ASR_RATE_LIMIT = 0
+    Config.LOCAL_ASR_LATENCY_MS = 0
+    Config.LOCAL_ASR_LATENCY_JITTER_MS = 0
+    Config.ASR_CACHE_ENABLED = False
+
+    print("运行分割流程...")
+    splitter = AudioSplitter(input_folder, output_folder)
+    start_time = time.perf_counter()
+    try:
+        results = splitter.process_batch()
+    finally:
+        splitter.close()
+    elapsed = time.perf_counter() - start_time
+
+    detected_total = expected_total = matched_total = 0
+    segments = keyword_correct = 0
+    for result in results:
+        duration, transcript = recordings[result["input_file"]]
+        detected = [ms for file_info in result["saved_files"] for ms in (file_info["start_ms"], file_info["end_ms"])]
+        expected = expected_boundaries(transcript, int(duration * 1000))
+        detected_total += len(detected)
+        expected_total += len(expected)
+        matched_total += match_boundaries(detected, expected, tolerance_ms)
+
+        for file_info in result["saved_files"]:
+            segments += 1
+            truth = expected_keyword(transcript, file_info["start_ms"], file_info["end_ms"])
+            keyword_correct += file_info["analysis"]["keyword"] == truth
+
+    return {
+        "time": time.strftime('%Y-%m-%d %H:%M:%S'),
+        "files": files,
+        "audio_seconds": round(audio_seconds, 2),
+        "elapsed_seconds": round(elapsed, 3),
+        "real_time_factor": round(elapsed / audio_seconds, 5) if audio_seconds else None,
+        "peak_rss_mb": peak_rss_mb(),
+        "peak_rss_before_processing_mb": rss_before,
+        "segments": segments,
+        "boundary_tolerance_ms": tolerance_ms,
+        "boundary_precision": round(matched_total / detected_total, 4) if detected_total else 0.0,
+        "boundary_recall": round(matched_total / expected_total, 4) if expected_total else 0.0,
+        "keyword_accuracy": round(keyword_correct / segments, 4) if segments else 0.0,
+        "config": {key: getattr(Config, key) for key in segmentation.RunManifest.PARAM_KEYS
+                   + ("STREAMING_MODE", "ASR_PACKING", "PIPELINE_QUEUE_SIZE", "PIPELINE_WRITE_WORKERS")}
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="用合成录音测量分割流程的速度与边界准确率")
+    parser.add_argument("--minutes", type=float, default=10, help="每段合成录音的时长(分钟)")
+    parser.add_argument("--files", type=int, default=2, help="合成录音数量")
+    parser.add_argument("--seed", type=int, default=0, help="随机种子，相同种子合成相同的录音")
+    parser.add_argument("--tolerance-ms", type=int, default=150, help="边界匹配容差(毫秒)，需覆盖音节渐入渐出的时长")
+    parser.add_argument("--work-dir", help="合成录音和输出片段的目录，默认使用临时目录并在结束后删除")
+    parser.add_argument("--streaming", action="store_true", help="使用流式分割模式")
+    parser.add_argument("--packing", action="store_true", help="使用拼接识别")
+    parser.add_argument("--output", default="benchmark_results.json", help="结果JSON文件，每次运行追加一条记录")
+    args = parser.parse_args()
+
+    Config.STREAMING_MODE = args.streaming
+    Config.ASR_PACKING = args.packing
+    segmentation.logger.setLevel("WARNING")
+
+    work_dir = args.work_dir or tempfile.mkdtemp(prefix="segmentation_benchmark_")
+    try:
+        report = run_benchmark(work_dir, args.minutes, args.files, args.seed, args.tolerance_ms)
+    finally:
+        if not args.work_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    # 结果文件保存历次运行记录，便于比较速度和准确率的回退
+    history = []
+    if os.path.exists(args.output):
+        with open(args.output, 'r', encoding='utf-8') as f:
+            history = json.load(f)
+    history.append(report)
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(history, f, ensure_ascii=False, indent=2)
+
+    print(f"\n录音时长: {report['audio_seconds']:.1f} 秒, 处理耗时: {report['elapsed_seconds']:.2f} 秒, "
+          f"实时率(RTF): {report['real_time_factor']:.4f}")
+    print(f"峰值内存: {report['peak_rss_mb']} MB")
+    print(f"片段数: {report['segments']}, 边界精确率: {report['boundary_precision'] * 100:.1f}%, "
+          f"召回率: {report['boundary_recall'] * 100:.1f}% (容差 {report['boundary_tolerance_ms']}ms), "
+          f"关键词准确率: {report['keyword_accuracy'] * 100:.1f}%")
+    print(f"结果已追加到 {args.output}")
@@ -1,15 +1,31 @@
 import os
+import argparse
 import numpy as np
 import librosa
+import soxr
 import soundfile as sf
 from pydub import AudioSegment
 from pydub import silence
+from pydub.utils import db_to_float, get_encoder_name, mediainfo
 import logging
 from pathlib import Path
 import time
 import azure.cognitiveservices.speech as speechsdk
 import re
+import subprocess
 import tempfile
+import wave
+import threading
+import sqlite3
+import hashlib
+import json
+import itertools
+import random
+import math
+import queue
+import contextlib
+from collections import deque, Counter
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
 
 # 设置日志格式
 logging.basicConfig(level=logging.INFO,
@@ -24,15 +40,49 @@ class Config:
     SPEECH_KEY = "YOUR_API_KEY"  # 请替换为你的密钥
     SPEECH_REGION = "westus2"  # 请替换为你的区域
     SPEECH_LANGUAGE = "en-US"
+    ASR_BACKEND = "azure"  # 识别后端: "azure"(微软ASR) 或 "local"(本地模拟，用于离线压测)
+    ASR_CONCURRENCY = 4  # 同时进行的识别请求数(识别器池大小)
+    ASR_RATE_LIMIT = 20  # 令牌桶速率(每秒请求数)，按Azure定价层的速率限制设置，0表示不限速
+    ASR_RATE_BURST = 20  # 令牌桶容量(允许的突发请求数)
+    ASR_SESSION_TIMEOUT = 600  # 连续识别送完音频后等待会话结束的最长时间(秒)，超时视为识别失败
+    ASR_CACHE_ENABLED = True  # 是否启用识别结果缓存(按片段PCM内容寻址)
+    ASR_CACHE_PATH = None  # 缓存数据库路径，None表示使用输出文件夹下的asr_cache.sqlite
+    ASR_CACHE_MAX_ENTRIES = 500000  # 缓存最大条目数，超出后按最近最少使用淘汰
+    ASR_PACKING = False  # 将多个短片段拼接为一个请求识别，按时间偏移映射回各片段
+    PACK_SEPARATOR_MS = 1000  # 拼接时片段之间插入的静音时长(毫秒)
+    PACK_MAX_DURATION_MS = 60000  # 每个拼接请求的最大时长(毫秒)
+    PACK_BOUNDARY_TOLERANCE_MS = 150  # 词边界超出片段范围的容差(毫秒)，超出则视为映射不明确
+
+    # 本地模拟识别后端配置
+    LOCAL_ASR_TRANSCRIPTS = None  # 固定返回的文本列表，None表示使用KEYWORDS；录音旁有.transcript.json时优先使用
+    LOCAL_ASR_LATENCY_MS = 300  # 模拟的平均识别延迟(毫秒)
+    LOCAL_ASR_LATENCY_JITTER_MS = 100  # 延迟的标准差(毫秒)
+    LOCAL_ASR_ERROR_RATE = 0.0  # 模拟识别取消(网络错误)的概率
+    LOCAL_ASR_NO_MATCH_RATE = 0.0  # 模拟无法识别的概率
 
     # 文件路径配置
     INPUT_FOLDER = "E:/Download/Audio"  # 输入音频文件夹
     OUTPUT_FOLDER = "D:/project/LooktechVoice/results"  # 输出音频文件夹
+    BATCH_WORKERS = 1  # 批处理进程数，大于1时按文件分片到多个进程并行处理
+    PIPELINE_QUEUE_SIZE = 16  # 单个文件内 解码→分析→写出 流水线各阶段之间队列的容量(片段数)
+    PIPELINE_ANALYZE_WORKERS = None  # 分析/识别阶段线程数，为None时与ASR_CONCURRENCY相同
+    PIPELINE_WRITE_WORKERS = 2  # 写出阶段线程数
+    MANIFEST_FILENAME = "manifest.jsonl"  # 输出文件夹中记录已完成文件的清单，用于断点续跑
+    STATS_FILENAME = "stats.json"  # 输出文件夹中定期更新的批处理统计
+    METRICS_ENABLED = True  # 记录各处理阶段的耗时、调用次数和处理字节数
+    METRICS_FILENAME = "metrics.jsonl"  # 输出文件夹中的阶段耗时记录(每个文件每个阶段一行，最后为全部文件的汇总)
+    METRICS_MAX_SAMPLES = 10000  # 每个阶段保留的单次耗时样本数上限(用于计算分位数)
+    PROFILE_FILE = None  # 需要性能剖析的输入文件名(如"US_NY_M_20.wav")，为None时不剖析
+    PROFILE_TOOL = "cProfile"  # 剖析工具: "cProfile" 或 "pyinstrument"
+    STATS_FLUSH_SECONDS = 30  # 统计文件写出和进度输出的间隔(秒)
+    STATS_DB_BINS = (-60, 0, 2)  # 音量直方图分箱 (起点, 终点, 宽度)，单位dB
+    STATS_WPS_BINS = (0, 6, 0.25)  # 语速直方图分箱 (起点, 终点, 宽度)，单位单词/秒
 
     # 音频处理参数
     SAMPLE_RATE = 16000  # 采样率
     BIT_DEPTH = 16  # 位深度
     CHANNELS = 1  # 单声道
+    NORMALIZE_ON_DECODE = True  # 解码时即转换为SAMPLE_RATE/CHANNELS/16位，后续各阶段和输出片段都使用该格式，无需再单独重采样
 
     # 分割参数
     MIN_SILENCE_LEN = 800  # 最小静音长度(毫秒)
@@ -40,10 +90,47 @@ class Config:
     KEEP_SILENCE = 300  # 保留静音部分(毫秒)
     MIN_SEGMENT_DURATION = 500  # 最小片段时长(毫秒)
     MAX_SEGMENT_DURATION = 2500  # 最大片段时长(毫秒)
+    SPLIT_STRATEGY = "energy"  # 超长片段再分割方式: "energy"(切点放在允许范围内能量最低处) 或 "equal"(等分)
+    SPLIT_ENERGY_WINDOW_MS = 50  # 寻找切点时能量平滑窗口(毫秒)，避免切在单个低能量帧（如爆破音前的闭塞段）
+    SEGMENTATION_MODE = "silence"  # 分割模式: "silence"(先静音分割再逐段识别) 或 "continuous"(整段连续识别后按关键词词边界切分)
+    WORD_CUT_MARGIN_MS = 200  # continuous模式下关键词首尾词边界外保留的时长(毫秒)
+    SILENCE_ENGINE = "numpy"  # 静音检测引擎: "numpy"(向量化分帧) 或 "pydub"(split_on_silence)
+    SILENCE_FRAME_MS = 10  # 能量索引、语音判定等帧级特征的分帧长度(毫秒)
+    SILENCE_SEEK_MS = 1  # numpy引擎静音窗口的滑动步长(毫秒)，与pydub逐毫秒判断一致
+    STREAMING_MODE = False  # 流式分割：分块解码并逐个输出片段，内存占用与录音时长无关
+    STREAM_BLOCK_SECONDS = 30  # 流式解码每块的时长(秒)
+
+    # 识别前语音判定参数
+    SPEECH_GATE_MODE = "off"  # 语音判定: "off"(不判定), "tag"(仍然识别，只在分析结果中记录判定) 或 "drop"(非语音片段不识别也不保存)
+    GATE_FRAME_MS = 25  # 判定特征的分析帧长(毫秒)，帧移为SILENCE_FRAME_MS
+    GATE_MIN_VOICED_MS = 150  # 有声帧总时长下限(毫秒)，低于该值视为点击声等短促噪声
+    GATE_MAX_FLATNESS = 0.4  # 有声帧平均谱平坦度上限，白噪声约为0.56，浊音语音通常低于0.2
+    GATE_MAX_ZCR = 0.35  # 有声帧平均过零率上限，超过视为嘶声类噪声
+    GATE_MAX_ENTROPY = 0.97  # 归一化能量熵上限，超过视为能量平稳的背景噪声
+
+    # 离线模板匹配参数
+    OFFLINE_LABELER = False  # 先用关键词模板离线标注，只有置信度不足的片段才请求ASR
+    TEMPLATE_FOLDER = None  # 已标注片段所在文件夹(文件名中含关键词)，为None时使用输出文件夹中已有的片段
+    TEMPLATES_PER_KEYWORD = 10  # 每个关键词加载的模板数
+    TEMPLATE_SAMPLE_RATE = 16000  # 模板特征的采样率
+    TEMPLATE_N_MFCC = 13  # MFCC维数
+    TEMPLATE_TRIM_DB = 30  # 提取特征前去除首尾静音的阈值(低于峰值的dB数)
+    TEMPLATE_MAX_DISTANCE = 0.9  # 可信标注的最大DTW距离
+    TEMPLATE_MAX_MARGIN = 0.8  # 可信标注要求最佳距离/其他关键词最佳距离不超过该比值
+    TEMPLATE_AUDIT_RATE = 0.05  # 可信的离线标注中仍抽样请求ASR的比例，用于统计与ASR的一致率
+
+    # 保存前的筛选条件，不满足的片段不写出音频
+    ACCEPT_REQUIRE_KEYWORD = False  # 只保存匹配到关键词的片段（取代事后运行delete_unknown_audio.py）
+    ACCEPT_DB_RANGE = None  # 保存片段的音量范围(dB)，如(-35, -5)，为None时不限制
+    ACCEPT_WPS_RANGE = None  # 保存片段的语速范围(单词/秒)，如(0.5, 4.0)，为None时不限制
+    ACCEPT_MIN_CONFIDENCE = None  # ASR最低置信度(0~1)，没有置信度的结果(拼接识别、离线标注)不受限制
+    REJECT_ACTION = "log"  # 不满足条件的片段: "log"(记录到输出文件夹的rejects.jsonl) 或 "drop"(直接丢弃)
+    REJECTS_FILENAME = "rejects.jsonl"  # 未保存片段的记录文件(录音路径与起止毫秒，不写出音频)
 
     # 音量判断参数
     VOLUME_HIGH_THRESHOLD = -15  # 高音量阈值(dB)
     VOLUME_LOW_THRESHOLD = -25  # 低音量阈值(dB)
+    VOLUME_USE_SPEECH_DB = False  # 音量级别按有声帧响度判断(不受首尾保留静音影响)，否则按片段整体响度
 
     # 语速判断参数
     FAST_THRESHOLD = 2.5  # 快速语速阈值（字/秒）
@@ -90,8 +177,228 @@ class Config:
     }
 
 
-class SpeechRecognizer:
-    """语音识别类"""
+class StageMetrics:
+    """各处理阶段的耗时统计
+
+    记录每个阶段的调用次数、总耗时、处理字节数和单次耗时样本（超过上限后按蓄水池抽样保留），
+    用于计算p50/p95/p99。线程安全，开销只有两次计时和一次加锁。
+    """
+
+    def __init__(self, max_samples=None):
+        """初始化空统计"""
+        self.max_samples = max_samples or Config.METRICS_MAX_SAMPLES
+        self._stages = {}
+        self._lock = threading.Lock()
+        self._random = random.Random(0)
+
+    @staticmethod
+    def _empty():
+        """单个阶段的初始统计"""
+        return {"count": 0, "wall_sec": 0.0, "bytes": 0, "samples": []}
+
+    def record(self, stage, seconds, nbytes=0):
+        """记录一次调用"""
+        if not Config.METRICS_ENABLED:
+            return
+        with self._lock:
+            entry = self._stages.setdefault(stage, self._empty())
+            entry["count"] += 1
+            entry["wall_sec"] += seconds
+            entry["bytes"] += nbytes
+            self._add_sample(entry, seconds)
+
+    def _add_sample(self, entry, seconds):
+        """蓄水池抽样保留耗时样本"""
+        if len(entry["samples"]) < self.max_samples:
+            entry["samples"].append(seconds)
+        else:
+            index = self._random.randrange(entry["count"])
+            if index < self.max_samples:
+                entry["samples"][index] = seconds
+
+    def timed(self, stage, nbytes=0):
+        """计时上下文管理器: with METRICS.timed("stage", 字节数): ..."""
+        return _StageTimer(self, stage, nbytes)
+
+    def measure(self, stage):
+        """计时装饰器，记录被装饰函数每次调用的耗时"""
+        def decorator(func):
+            def wrapper(*args, **kwargs):
+                with self.timed(stage):
+                    return func(*args, **kwargs)
+            wrapper.__name__ = func.__name__
+            wrapper.__doc__ = func.__doc__
+            return wrapper
+        return decorator
+
+    def drain(self):
+        """取出当前统计并清空，返回可序列化的原始数据 {阶段: {"count", "wall_sec", "bytes", "samples"}}"""
+        with self._lock:
+            stages, self._stages = self._stages, {}
+        return stages
+
+    def merge(self, stages):
+        """合并drain()得到的原始数据（如工作进程返回的统计）"""
+        with self._lock:
+            for stage, data in stages.items():
+                entry = self._stages.setdefault(stage, self._empty())
+                for seconds in data["samples"]:
+                    entry["count"] += 1
+                    self._add_sample(entry, seconds)
+                # 样本数可能少于调用次数，调用次数和总量以原始统计为准
+                entry["count"] += data["count"] - len(data["samples"])
+                entry["wall_sec"] += data["wall_sec"]
+                entry["bytes"] += data["bytes"]
+
+    @staticmethod
+    def summarize(stages):
+        """原始数据汇总为每个阶段一条记录（耗时单位为毫秒）"""
+        summary = []
+        for stage, data in sorted(stages.items()):
+            samples = np.asarray(data["samples"]) * 1000
+            p50, p95, p99 = np.percentile(samples, [50, 95, 99]) if len(samples) else (0.0, 0.0, 0.0)
+            summary.append({
+                "stage": stage,
+                "count": data["count"],
+                "wall_sec": round(data["wall_sec"], 4),
+                "bytes": data["bytes"],
+                "mb_per_sec": round(data["bytes"] / data["wall_sec"] / 1e6, 3) if data["wall_sec"] > 0 else 0.0,
+                "mean_ms": round(data["wall_sec"] * 1000 / data["count"], 3) if data["count"] else 0.0,
+                "p50_ms": round(float(p50), 3),
+                "p95_ms": round(float(p95), 3),
+                "p99_ms": round(float(p99), 3)
+            })
+        return summary
+
+
+class _StageTimer:
+    """StageMetrics.timed返回的计时器"""
+
+    __slots__ = ("metrics", "stage", "nbytes", "start")
+
+    def __init__(self, metrics, stage, nbytes):
+        self.metrics = metrics
+        self.stage = stage
+        self.nbytes = nbytes
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.metrics.record(self.stage, time.perf_counter() - self.start, self.nbytes)
+        return False
+
+
+# 进程内的阶段耗时统计，每处理完一个文件由AudioSplitter取出
+METRICS = StageMetrics()
+
+
+class ProfileSession:
+    """单个文件的性能剖析
+
+    cProfile只能剖析启用它的线程，流水线各阶段线程通过thread_profile()各自启用一个剖析器，
+    结束时合并写出；pyinstrument只剖析调用线程（未安装时退回cProfile）。
+    """
+
+    def __init__(self, output_path, tool=None):
+        """output_path为不含扩展名的输出路径"""
+        self.output_path = output_path
+        self.tool = tool or Config.PROFILE_TOOL
+        self._profiles = []
+        self._lock = threading.Lock()
+        self._profiler = None
+
+        if self.tool == "pyinstrument":
+            try:
+                import pyinstrument
+            except ImportError:
+                logger.warning("未安装pyinstrument，改用cProfile")
+                self.tool = "cProfile"
+
+    def __enter__(self):
+        if self.tool == "pyinstrument":
+            import pyinstrument
+            self._profiler = pyinstrument.Profiler()
+            self._profiler.start()
+        else:
+            self._profiler = self._start_cprofile()
+        return self
+
+    def _start_cprofile(self):
+        """在当前线程启用一个cProfile剖析器"""
+        import cProfile
+        profiler = cProfile.Profile()
+        with self._lock:
+            self._profiles.append(profiler)
+        profiler.enable()
+        return profiler
+
+    def thread_profile(self, target):
+        """包装线程函数，使其在cProfile下运行"""
+        if self.tool != "cProfile":
+            return target
+
+        def profiled():
+            profiler = self._start_cprofile()
+            try:
+                target()
+            finally:
+                profiler.disable()
+        return profiled
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self.tool == "pyinstrument":
+            self._profiler.stop()
+            path = self.output_path + ".html"
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write(self._profiler.output_html())
+        else:
+            import pstats
+            self._profiler.disable()
+            path = self.output_path + ".prof"
+            with self._lock:
+                stats = pstats.Stats(*self._profiles)
+            stats.dump_stats(path)
+        logger.info(f"性能剖析结果已保存: {path}")
+        return False
+
+
+class RecognitionCanceledError(RuntimeError):
+    """连续识别因错误取消或超时，已收到的词级结果不完整"""
+
+
+class RecognizerBackend:
+    """语音识别后端接口
+
+    AudioSplitter只通过该接口识别PCM数据，返回 {"text": 识别文本, "reason": 结果原因, "confidence": 置信度}，
+    后端不提供置信度时confidence为None。
+    context为片段来源信息 {"source": 录音路径, "start_ms": 起始毫秒, "end_ms": 结束毫秒}，可为None。
+    """
+
+    name = "base"
+
+    def recognize_pcm_result(self, pcm_data, sample_rate, bits_per_sample=16, channels=1, context=None):
+        """识别PCM数据"""
+        raise NotImplementedError
+
+    def recognize_from_pcm(self, pcm_data, sample_rate, bits_per_sample=16, channels=1, context=None):
+        """识别PCM数据，返回识别文本"""
+        return self.recognize_pcm_result(pcm_data, sample_rate, bits_per_sample, channels, context)["text"]
+
+    def recognize_words(self, pcm_blocks, sample_rate, bits_per_sample=16, channels=1, context=None):
+        """对整段录音做一次连续识别，返回词级时间戳 [{"word", "start_ms", "end_ms"}, ...]
+
+        pcm_blocks为可迭代的PCM字节块，边解码边送入识别，不需要一次性载入整段录音。
+        识别因错误取消或超时时抛出RecognitionCanceledError，不返回不完整的结果。
+        """
+        raise NotImplementedError
+
+
+class SpeechRecognizer(RecognizerBackend):
+    """语音识别类（微软Azure后端）"""
+
+    name = "azure"
 
     def __init__(self):
         """初始化语音识别器"""
@@ -102,6 +409,8 @@ class SpeechRecognizer:
         )
         # 设置识别语言
         self.speech_config.speech_recognition_language = Config.SPEECH_LANGUAGE
+        # 详细输出，结果中带有NBest置信度
+        self.speech_config.output_format = speechsdk.OutputFormat.Detailed
 
     def recognize_from_file(self, audio_file):
         """从文件识别语音"""
@@ -118,49 +427,661 @@ class SpeechRecognizer:
 
         # 执行识别
         result = speech_recognizer.recognize_once_async().get()
+        return self._parse_result(result)
+
+    def recognize_pcm_result(self, pcm_data, sample_rate, bits_per_sample=16, channels=1, context=None):
+        """通过推送流直接识别内存中的PCM数据，无需写出临时文件"""
+        # 创建推送流并一次性写入整段PCM
+        stream_format = speechsdk.audio.AudioStreamFormat(
+            samples_per_second=sample_rate,
+            bits_per_sample=bits_per_sample,
+            channels=channels
+        )
+        push_stream = speechsdk.audio.PushAudioInputStream(stream_format=stream_format)
+        push_stream.write(pcm_data)
+        push_stream.close()
+
+        # 创建语音识别器
+        speech_recognizer = speechsdk.SpeechRecognizer(
+            speech_config=self.speech_config,
+            audio_config=speechsdk.audio.AudioConfig(stream=push_stream)
+        )
 
-        # 分析结果
+        logger.debug(f"开始识别PCM数据: {len(pcm_data)} 字节, {sample_rate}Hz")
+
+        # 执行识别
+        with METRICS.timed("azure_recognize", len(pcm_data)):
+            result = speech_recognizer.recognize_once_async().get()
+        return self._parse_result_detail(result)
+
+    def recognize_words(self, pcm_blocks, sample_rate, bits_per_sample=16, channels=1, context=None):
+        """连续识别整段PCM，请求词级时间戳"""
+        # 连续识别使用单独的配置，开启词级时间戳和详细输出
+        speech_config = speechsdk.SpeechConfig(subscription=Config.SPEECH_KEY, region=Config.SPEECH_REGION)
+        speech_config.speech_recognition_language = Config.SPEECH_LANGUAGE
+        speech_config.request_word_level_timestamps()
+        speech_config.output_format = speechsdk.OutputFormat.Detailed
+
+        stream_format = speechsdk.audio.AudioStreamFormat(
+            samples_per_second=sample_rate,
+            bits_per_sample=bits_per_sample,
+            channels=channels
+        )
+        push_stream = speechsdk.audio.PushAudioInputStream(stream_format=stream_format)
+        speech_recognizer = speechsdk.SpeechRecognizer(
+            speech_config=speech_config,
+            audio_config=speechsdk.audio.AudioConfig(stream=push_stream)
+        )
+
+        words = []
+        errors = []
+        done = threading.Event()
+
+        def on_recognized(evt):
+            if evt.result.reason != speechsdk.ResultReason.RecognizedSpeech:
+                return
+            detail = json.loads(evt.result.json)
+            if not detail.get("NBest"):
+                return
+            # 时间单位为100纳秒
+            for word in detail["NBest"][0].get("Words", []):
+                words.append({
+                    "word": word["Word"],
+                    "start_ms": word["Offset"] / 10000,
+                    "end_ms": (word["Offset"] + word["Duration"]) / 10000
+                })
+            logger.info(f"识别结果: {evt.result.text}")
+
+        def on_canceled(evt):
+            if evt.cancellation_details.reason == speechsdk.CancellationReason.Error:
+                logger.error(f"连续识别取消: {evt.cancellation_details.error_details}")
+                errors.append(evt.cancellation_details.error_details)
+            done.set()
+
+        speech_recognizer.recognized.connect(on_recognized)
+        speech_recognizer.session_stopped.connect(lambda evt: done.set())
+        speech_recognizer.canceled.connect(on_canceled)
+
+        logger.info(f"开始连续识别: {context['source'] if context else ''}")
+        with METRICS.timed("azure_continuous") as timer:
+            speech_recognizer.start_continuous_recognition()
+            try:
+                for block in pcm_blocks:
+                    push_stream.write(block)
+                    timer.nbytes += len(block)
+            finally:
+                push_stream.close()
+            finished = done.wait(Config.ASR_SESSION_TIMEOUT)
+            speech_recognizer.stop_continuous_recognition()
+
+        if errors:
+            raise RecognitionCanceledError(f"连续识别取消: {errors[0]}")
+        if not finished:
+            raise RecognitionCanceledError(f"连续识别超时: {Config.ASR_SESSION_TIMEOUT} 秒内会话未结束")
+        return sorted(words, key=lambda word: word["start_ms"])
+
+    def _parse_result(self, result):
+        """分析识别结果，返回识别文本"""
+        return self._parse_result_detail(result)["text"]
+
+    def _parse_result_detail(self, result):
+        """分析识别结果，返回包含识别文本、结果原因和置信度的字典"""
         if result.reason == speechsdk.ResultReason.RecognizedSpeech:
             recognized_text = result.text
-            logger.info(f"识别结果: {recognized_text}")
-            return recognized_text
+            confidence = self._parse_confidence(result)
+            logger.info(f"识别结果: {recognized_text} (置信度: {confidence})")
+            return {"text": recognized_text, "reason": "RecognizedSpeech", "confidence": confidence}
         elif result.reason == speechsdk.ResultReason.NoMatch:
             logger.warning(f"无法识别语音: {result.no_match_details}")
-            return ""
+            return {"text": "", "reason": "NoMatch", "confidence": None}
         elif result.reason == speechsdk.ResultReason.Canceled:
             cancellation = result.cancellation_details
             logger.error(f"识别取消: {cancellation.reason}")
             if cancellation.reason == speechsdk.CancellationReason.Error:
                 logger.error(f"错误详情: {cancellation.error_details}")
-            return ""
+            return {"text": "", "reason": "Canceled", "confidence": None}
+
+        return {"text": "", "reason": str(result.reason), "confidence": None}
+
+    @staticmethod
+    def _parse_confidence(result):
+        """从详细输出的JSON中读取最佳候选(NBest[0])的置信度"""
+        try:
+            nbest = json.loads(result.json).get("NBest")
+        except (TypeError, ValueError):
+            return None
+        return nbest[0].get("Confidence") if nbest else None
+
+
+class LocalRecognizerBackend(RecognizerBackend):
+    """本地模拟识别后端
+
+    不访问网络，按配置的延迟和错误率返回文本，用于离线压测和回归测试。
+    录音旁存在 <录音文件名>.transcript.json（[{"start_ms", "end_ms", "text", "confidence"(可选)}, ...]）时，
+    返回与片段重叠超过一半的标注文本；否则按片段内容哈希从固定文本列表中选取。
+    置信度取标注中的confidence（缺省为1.0），没有标注文件时由内容哈希确定。
+    """
+
+    name = "local"
+
+    def __init__(self, transcripts=None, latency_ms=None, jitter_ms=None, error_rate=None, no_match_rate=None):
+        """初始化模拟参数"""
+        self.transcripts = transcripts or Config.LOCAL_ASR_TRANSCRIPTS or Config.KEYWORDS
+        self.latency_ms = Config.LOCAL_ASR_LATENCY_MS if latency_ms is None else latency_ms
+        self.jitter_ms = Config.LOCAL_ASR_LATENCY_JITTER_MS if jitter_ms is None else jitter_ms
+        self.error_rate = Config.LOCAL_ASR_ERROR_RATE if error_rate is None else error_rate
+        self.no_match_rate = Config.LOCAL_ASR_NO_MATCH_RATE if no_match_rate is None else no_match_rate
+
+        self._sidecars = {}
+        self._lock = threading.Lock()
+        self._random = random.Random()
+
+    @staticmethod
+    def sidecar_path(source):
+        """录音对应的标注文件路径"""
+        return f"{source}.transcript.json"
+
+    def _load_sidecar(self, source):
+        """读取并缓存录音的标注文件，不存在时返回None"""
+        with self._lock:
+            if source not in self._sidecars:
+                path = self.sidecar_path(source)
+                entries = None
+                if os.path.exists(path):
+                    with open(path, 'r', encoding='utf-8') as f:
+                        entries = json.load(f)
+                self._sidecars[source] = entries
+            return self._sidecars[source]
+
+    def _lookup_text(self, pcm_data, context):
+        """查找片段对应的文本"""
+        return self._lookup(pcm_data, context)[0]
+
+    def _lookup(self, pcm_data, context):
+        """查找片段对应的 (文本, 置信度)"""
+        entries = None
+        if context and context.get("source") and "start_ms" in context:
+            entries = self._load_sidecar(context["source"])
+        if entries is None:
+            digest = int(hashlib.md5(pcm_data).hexdigest(), 16)
+            return self.transcripts[digest % len(self.transcripts)], 0.5 + (digest >> 64) % 501 / 1000
+
+        texts = []
+        confidences = []
+        for entry in entries:
+            overlap = min(entry["end_ms"], context["end_ms"]) - max(entry["start_ms"], context["start_ms"])
+            if overlap * 2 > entry["end_ms"] - entry["start_ms"]:
+                texts.append(entry["text"])
+                confidences.append(entry.get("confidence", 1.0))
+        return " ".join(texts), min(confidences, default=None)
+
+    def recognize_pcm_result(self, pcm_data, sample_rate, bits_per_sample=16, channels=1, context=None):
+        """模拟识别：等待设定的延迟后按概率返回错误、无法识别或标注文本"""
+        with self._lock:
+            latency = max(0.0, self._random.gauss(self.latency_ms, self.jitter_ms))
+            roll = self._random.random()
+        time.sleep(latency / 1000)
+
+        if roll < self.error_rate:
+            logger.error("识别取消: 本地后端模拟错误")
+            return {"text": "", "reason": "Canceled", "confidence": None}
+
+        text, confidence = self._lookup(pcm_data, context)
+        if not text or roll < self.error_rate + self.no_match_rate:
+            logger.warning("无法识别语音: 本地后端无匹配文本")
+            return {"text": "", "reason": "NoMatch", "confidence": None}
+
+        logger.info(f"识别结果: {text}")
+        return {"text": text, "reason": "RecognizedSpeech", "confidence": confidence}
+
+    @staticmethod
+    def _spread_words(text, start_ms, end_ms):
+        """将文本中的词均匀分布在给定区间内"""
+        text_words = text.split()
+        step = (end_ms - start_ms) / max(1, len(text_words))
+        return [{
+            "word": word,
+            "start_ms": start_ms + i * step,
+            "end_ms": start_ms + (i + 1) * step
+        } for i, word in enumerate(text_words)]
+
+    def recognize_words(self, pcm_blocks, sample_rate, bits_per_sample=16, channels=1, context=None):
+        """模拟连续识别：标注文本中的词在各自标注区间内均匀分布
+
+        context中带有segments（拼接识别）时，各片段的文本按单段规则查找，并分布在其拼接后的时间范围内。
+        """
+        # 消耗输入流，与真实后端的解码开销保持一致
+        total_bytes = sum(len(block) for block in pcm_blocks)
+        with self._lock:
+            latency = max(0.0, self._random.gauss(self.latency_ms, self.jitter_ms))
+            roll = self._random.random()
+        time.sleep(latency / 1000)
+
+        if roll < self.error_rate:
+            raise RecognitionCanceledError("连续识别取消: 本地后端模拟错误")
+
+        if context and context.get("segments"):
+            words = []
+            for segment in context["segments"]:
+                text = self._lookup_text(b'', segment) if "start_ms" in segment else ""
+                words.extend(self._spread_words(text, segment["packed_start_ms"], segment["packed_end_ms"]))
+            return words
+
+        entries = self._load_sidecar(context["source"]) if context and context.get("source") else None
+        if entries is None:
+            logger.warning(f"本地后端没有标注文件，无法模拟连续识别 ({total_bytes} 字节)")
+            return []
+
+        words = []
+        for entry in entries:
+            words.extend(self._spread_words(entry["text"], entry["start_ms"], entry["end_ms"]))
+        return words
+
+
+def create_recognizer_backend(backend=None):
+    """根据配置创建识别后端"""
+    backend = backend or Config.ASR_BACKEND
+    if backend == "azure":
+        return SpeechRecognizer()
+    elif backend == "local":
+        return LocalRecognizerBackend()
+    raise ValueError(f"未知的识别后端: {backend}")
+
+
+class AsrCache:
+    """基于SQLite的识别结果缓存
+
+    以片段PCM、采样参数、识别语言和识别后端的哈希为键，保存识别文本、结果原因和置信度，跨运行复用。
+    本地后端的模拟结果与Azure的真实结果键不同，共用输出文件夹时不会互相命中。
+    条目数超过上限时按最近使用时间淘汰。
+    """
+
+    # 只缓存确定性的识别结果，取消(网络错误、限流等)的结果需要重试
+    CACHEABLE_REASONS = ("RecognizedSpeech", "NoMatch")
+
+    def __init__(self, db_path, max_entries=None):
+        """打开(或创建)缓存数据库"""
+        self.db_path = db_path
+        self.max_entries = max_entries or Config.ASR_CACHE_MAX_ENTRIES
+        self.hits = 0
+        self.misses = 0
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS asr_cache ("
+            "key TEXT PRIMARY KEY, text TEXT, reason TEXT, last_used REAL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_asr_cache_last_used ON asr_cache(last_used)")
+
+        # 旧版本的缓存没有置信度列，补充该列（旧条目的置信度为NULL）
+        columns = [row[1] for row in self._conn.execute("PRAGMA table_info(asr_cache)")]
+        if "confidence" not in columns:
+            self._conn.execute("ALTER TABLE asr_cache ADD COLUMN confidence REAL")
+        self._conn.commit()
+        self._entries = self._conn.execute("SELECT COUNT(*) FROM asr_cache").fetchone()[0]
+
+    @staticmethod
+    def make_key(pcm_data, sample_rate, bits_per_sample=16, channels=1, language=None, backend=None):
+        """计算缓存键：识别后端 + PCM内容 + 采样参数 + 识别语言"""
+        language = language or Config.SPEECH_LANGUAGE
+        backend = backend or Config.ASR_BACKEND
+        digest = hashlib.sha256(f"{backend}|{language}|{sample_rate}|{bits_per_sample}|{channels}|".encode())
+        digest.update(pcm_data)
+        return digest.hexdigest()
+
+    def get(self, key):
+        """查询缓存，命中时刷新最近使用时间"""
+        with self._lock:
+            row = self._conn.execute("SELECT text, reason, confidence FROM asr_cache WHERE key = ?",
+                                     (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            self._conn.execute("UPDATE asr_cache SET last_used = ? WHERE key = ?", (time.time(), key))
+            self._conn.commit()
+            return {"text": row[0], "reason": row[1], "confidence": row[2]}
+
+    def put(self, key, result):
+        """写入识别结果，必要时淘汰最久未使用的条目"""
+        if result["reason"] not in self.CACHEABLE_REASONS:
+            return
+
+        with self._lock:
+            cursor = self._conn.execute(
+                "INSERT OR REPLACE INTO asr_cache (key, text, reason, confidence, last_used) VALUES (?, ?, ?, ?, ?)",
+                (key, result["text"], result["reason"], result.get("confidence"), time.time())
+            )
+            self._entries += cursor.rowcount
+
+            overflow = self._entries - self.max_entries
+            if overflow > 0:
+                self._conn.execute(
+                    "DELETE FROM asr_cache WHERE key IN "
+                    "(SELECT key FROM asr_cache ORDER BY last_used LIMIT ?)", (overflow,)
+                )
+                self._entries = self._conn.execute("SELECT COUNT(*) FROM asr_cache").fetchone()[0]
+            self._conn.commit()
+
+    def stats(self):
+        """返回缓存命中统计"""
+        lookups = self.hits + self.misses
+
+        # 多进程时其他进程也会写入，条目数以数据库为准
+        with self._lock:
+            self._entries = self._conn.execute("SELECT COUNT(*) FROM asr_cache").fetchone()[0]
+
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0,
+            "entries": self._entries
+        }
+
+    def close(self):
+        """关闭数据库连接"""
+        with self._lock:
+            self._conn.close()
+
+
+class TokenBucket:
+    """线程安全的令牌桶限速器"""
+
+    def __init__(self, rate, capacity):
+        """rate为每秒补充的令牌数，capacity为桶容量"""
+        self.rate = rate
+        self.capacity = max(1, capacity)
+        self._tokens = float(self.capacity)
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """获取一个令牌，令牌不足时阻塞等待"""
+        if self.rate <= 0:
+            return
+
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+            self._last = now
+
+            # 预先扣除令牌，令牌为负时后续请求依次顺延
+            wait = 0 if self._tokens >= 1 else (1 - self._tokens) / self.rate
+            self._tokens -= 1
+
+        if wait > 0:
+            time.sleep(wait)
+
 
-        return ""
+class AsrExecutor:
+    """并发语音识别执行器
+
+    维护一个可复用的识别器池，同时运行多个识别请求，并通过令牌桶限制请求速率。
+    """
+
+    def __init__(self, concurrency=None, rate_limit=None, burst=None, recognizer_factory=None, cache=None):
+        """初始化识别器池和线程池，cache为可选的AsrCache"""
+        self.concurrency = max(1, concurrency or Config.ASR_CONCURRENCY)
+        rate_limit = Config.ASR_RATE_LIMIT if rate_limit is None else rate_limit
+        burst = Config.ASR_RATE_BURST if burst is None else burst
+        recognizer_factory = recognizer_factory or create_recognizer_backend
+
+        self.cache = cache
+        self.rate_limiter = TokenBucket(rate_limit, burst)
+        self.recognizers = queue.Queue()
+        for _ in range(self.concurrency):
+            self.recognizers.put(recognizer_factory())
+        # 缓存键包含后端名称，不同后端的结果互不复用
+        self.backend_name = getattr(self.recognizers.queue[0], "name", Config.ASR_BACKEND)
+
+        self._executor = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix='asr')
+
+    def recognize_from_pcm(self, pcm_data, sample_rate, bits_per_sample=16, channels=1, context=None):
+        """识别PCM数据，返回识别文本"""
+        return self.recognize_pcm_result(pcm_data, sample_rate, bits_per_sample, channels, context)["text"]
+
+    def cache_key(self, pcm_data, sample_rate, bits_per_sample=16, channels=1):
+        """当前识别后端下的缓存键"""
+        return AsrCache.make_key(pcm_data, sample_rate, bits_per_sample, channels, backend=self.backend_name)
+
+    def lookup_cached(self, pcm_data, sample_rate, bits_per_sample=16, channels=1):
+        """只查询缓存，不发起识别请求"""
+        if self.cache is None:
+            return None
+        return self.cache.get(self.cache_key(pcm_data, sample_rate, bits_per_sample, channels))
+
+    def store_cached(self, pcm_data, sample_rate, result, bits_per_sample=16, channels=1):
+        """将其他途径得到的识别结果写入缓存"""
+        if self.cache is not None:
+            self.cache.put(self.cache_key(pcm_data, sample_rate, bits_per_sample, channels), result)
+
+    def recognize_pcm_result(self, pcm_data, sample_rate, bits_per_sample=16, channels=1, context=None):
+        """优先查询缓存，未命中时从池中取出识别器识别，用完后归还"""
+        cache_key = None
+        if self.cache is not None:
+            with METRICS.timed("asr_cache_lookup", len(pcm_data)):
+                cache_key = self.cache_key(pcm_data, sample_rate, bits_per_sample, channels)
+                cached = self.cache.get(cache_key)
+            if cached is not None:
+                logger.info(f"识别结果(缓存): {cached['text']}")
+                return cached
+
+        # 等待令牌和空闲识别器的时间单独统计，与识别请求本身的耗时区分
+        with METRICS.timed("asr_wait"):
+            self.rate_limiter.acquire()
+            recognizer = self.recognizers.get()
+        try:
+            with METRICS.timed("asr_request", len(pcm_data)):
+                result = recognizer.recognize_pcm_result(pcm_data, sample_rate, bits_per_sample, channels, context)
+        finally:
+            self.recognizers.put(recognizer)
+
+        if cache_key is not None:
+            self.cache.put(cache_key, result)
+        return result
+
+    def recognize_words(self, pcm_blocks, sample_rate, bits_per_sample=16, channels=1, context=None):
+        """从池中取出识别器做一次连续识别（整段录音只占用一个请求令牌）"""
+        self.rate_limiter.acquire()
+        recognizer = self.recognizers.get()
+        try:
+            return recognizer.recognize_words(pcm_blocks, sample_rate, bits_per_sample, channels, context)
+        finally:
+            self.recognizers.put(recognizer)
+
+    def map_ordered(self, func, items):
+        """并发执行func，按输入顺序逐个返回 (item, result)
+
+        同时提交的任务数有上限，items可以是生成器，不会被一次性展开。
+        """
+        max_in_flight = self.concurrency * 2
+        pending = deque()
+        for item in items:
+            pending.append((item, self._executor.submit(func, item)))
+            if len(pending) >= max_in_flight:
+                done_item, future = pending.popleft()
+                yield done_item, future.result()
+
+        while pending:
+            done_item, future = pending.popleft()
+            yield done_item, future.result()
+
+    def shutdown(self):
+        """关闭线程池和缓存"""
+        self._executor.shutdown(wait=True)
+        if self.cache is not None:
+            self.cache.close()
+
+
+class SegmentPacker:
+    """片段拼接识别类
+
+    将同一录音的多个短片段用固定长度的静音拼接成一个音频流，只发起一次连续识别，
+    再按词级时间偏移把识别结果映射回各片段。词边界落在静音间隔或跨越片段的片段视为映射不明确，
+    回退为逐段识别。
+    """
+
+    def __init__(self, asr_executor, count=None):
+        """count为计数回调 count(名称, 数量)"""
+        self.asr_executor = asr_executor
+        self.count = count or (lambda name, value=1: None)
+
+    @staticmethod
+    def to_asr_pcm(chunk):
+        """片段转换为16位单声道PCM"""
+        return chunk.set_channels(1).set_sample_width(2).raw_data
+
+    def iter_batches(self, items):
+        """将 (item, pcm, sample_rate, context) 按最大时长分批，同一批内采样率一致"""
+        batch = []
+        batch_ms = 0
+        for entry in items:
+            _, pcm, sample_rate, _ = entry
+            duration_ms = len(pcm) / 2 * 1000 / sample_rate
+            if batch and (batch_ms + duration_ms > Config.PACK_MAX_DURATION_MS or batch[0][2] != sample_rate):
+                yield batch
+                batch = []
+                batch_ms = 0
+            batch.append(entry)
+            batch_ms += duration_ms + Config.PACK_SEPARATOR_MS
+        if batch:
+            yield batch
+
+    def recognize_batch(self, batch):
+        """拼接一批片段识别一次，返回每个片段的识别文本，映射不明确的位置为None
+
+        拼接识别取消时抛出RecognitionCanceledError。
+        """
+        sample_rate = batch[0][2]
+        separator = b'\x00\x00' * int(sample_rate * Config.PACK_SEPARATOR_MS / 1000)
+
+        # 记录每个片段在拼接流中的时间范围
+        regions = []
+        segments = []
+        offset_ms = 0.0
+        blocks = []
+        for _, pcm, _, segment_context in batch:
+            duration_ms = len(pcm) / 2 * 1000 / sample_rate
+            regions.append((offset_ms, offset_ms + duration_ms))
+            segments.append(dict(segment_context or {}, packed_start_ms=offset_ms,
+                                 packed_end_ms=offset_ms + duration_ms))
+            blocks.extend((pcm, separator))
+            offset_ms += duration_ms + Config.PACK_SEPARATOR_MS
+
+        context = {"source": segments[0].get("source"), "segments": segments}
+        self.count("pack_requests")
+        self.count("packed_segments", len(batch))
+        words = self.asr_executor.recognize_words(blocks, sample_rate, context=context)
+
+        # 按时间偏移分配每个词
+        tolerance = Config.PACK_BOUNDARY_TOLERANCE_MS
+        segment_words = [[] for _ in batch]
+        ambiguous = set()
+        for word in words:
+            owner = None
+            for i, (start, end) in enumerate(regions):
+                if word["start_ms"] >= start - tolerance and word["end_ms"] <= end + tolerance:
+                    owner = i
+                    break
+            if owner is not None:
+                segment_words[owner].append(word["word"])
+                continue
+
+            # 落在静音间隔或跨越多个片段的词，相关片段全部回退
+            overlapped = [i for i, (start, end) in enumerate(regions)
+                          if word["start_ms"] < end + tolerance and word["end_ms"] > start - tolerance]
+            if not overlapped:
+                middle = (word["start_ms"] + word["end_ms"]) / 2
+                overlapped = [min(range(len(regions)), key=lambda i: min(abs(middle - regions[i][0]),
+                                                                         abs(middle - regions[i][1])))]
+            ambiguous.update(overlapped)
+
+        return [None if i in ambiguous else " ".join(texts) for i, texts in enumerate(segment_words)]
+
+    def recognize_prepared_batch(self, batch):
+        """识别一批片段，返回 [(item, 识别结果), ...]
+
+        先查询缓存，未命中的片段拼接识别，映射不明确的片段逐段识别。
+        拼接识别取消时本批全部逐段识别，不完整的拼接结果不写入缓存。
+        """
+        results = [self.asr_executor.lookup_cached(pcm, sample_rate) for _, pcm, sample_rate, _ in batch]
+        pending = [entry for entry, result in zip(batch, results) if result is None]
+
+        # 批内只剩一个片段时无需拼接
+        packed_texts = [None] * len(pending)
+        if len(pending) > 1:
+            try:
+                packed_texts = self.recognize_batch(pending)
+            except RecognitionCanceledError as e:
+                logger.warning(f"拼接识别失败，{len(pending)} 个片段改为逐段识别: {e}")
+        packed_iter = iter(packed_texts)
+
+        output = []
+        for (item, pcm, sample_rate, context), result in zip(batch, results):
+            if result is None:
+                text = next(packed_iter)
+                if text is None:
+                    if len(pending) > 1:
+                        self.count("pack_fallbacks")
+                    result = self.asr_executor.recognize_pcm_result(pcm, sample_rate, context=context)
+                else:
+                    # 拼接识别无法给出单个片段的置信度
+                    result = {"text": text, "reason": "RecognizedSpeech" if text else "NoMatch", "confidence": None}
+                    self.asr_executor.store_cached(pcm, sample_rate, result)
+            output.append((item, result))
+        return output
+
+    def recognize_items(self, items):
+        """逐个返回 (item, 识别结果)，items为可迭代的 (item, AudioSegment, 片段来源信息)，各批并发识别"""
+        def prepared():
+            for item, chunk, context in items:
+                yield item, self.to_asr_pcm(chunk), chunk.frame_rate, context
+
+        batches = self.asr_executor.map_ordered(self.recognize_prepared_batch, self.iter_batches(prepared()))
+        for _, batch_results in batches:
+            yield from batch_results
 
 
 class AudioAnalyzer:
     """音频分析类"""
 
+    @staticmethod
+    def classify_volume(volume_db):
+        """根据音量(dB)判断音量级别"""
+        if volume_db >= Config.VOLUME_HIGH_THRESHOLD:
+            return "high"
+        elif volume_db <= Config.VOLUME_LOW_THRESHOLD:
+            return "low"
+        return "normal"
+
     @staticmethod
     def analyze_volume(audio_file):
-        """分析音频音量"""
+        """分析音频文件音量"""
         # 加载音频
         audio = AudioSegment.from_file(audio_file)
 
         # 计算RMS音量(dB)
         volume_db = audio.dBFS
-
-        # 判断音量级别
-        if volume_db >= Config.VOLUME_HIGH_THRESHOLD:
-            volume_level = "high"
-        elif volume_db <= Config.VOLUME_LOW_THRESHOLD:
-            volume_level = "low"
-        else:
-            volume_level = "normal"
+        volume_level = AudioAnalyzer.classify_volume(volume_db)
 
         logger.info(f"音频 {audio_file} 的音量为 {volume_db:.2f}dB, 级别: {volume_level}")
         return volume_level, volume_db
 
     @staticmethod
+    def analyze_volume_segment(audio):
+        """分析内存中音频片段的音量，直接使用片段采样计算RMS"""
+        volume_db = audio.dBFS
+        volume_level = AudioAnalyzer.classify_volume(volume_db)
+
+        logger.info(f"片段音量为 {volume_db:.2f}dB, 级别: {volume_level}")
+        return volume_level, volume_db
+
+    @staticmethod
+    @METRICS.measure("speech_rate")
     def analyze_speech_rate(text, audio_duration_sec):
         """分析语速"""
         if not text or audio_duration_sec <= 0:
@@ -185,6 +1106,7 @@ class AudioAnalyzer:
         return speed_level, speech_rate
 
     @staticmethod
+    @METRICS.measure("match_keyword")
     def match_keyword(text):
         """匹配关键词"""
         if not text:
@@ -206,6 +1128,1279 @@ class AudioAnalyzer:
         logger.debug(f"未匹配到任何关键词, 原文: {text}")
         return None
 
+    @staticmethod
+    def check_acceptance(analysis):
+        """按保存条件检查分析结果，返回不满足的条件列表（为空表示接受）"""
+        reasons = []
+        if Config.ACCEPT_REQUIRE_KEYWORD and analysis["keyword"] == "Unknown":
+            reasons.append("no_keyword")
+        if Config.ACCEPT_DB_RANGE is not None:
+            low, high = Config.ACCEPT_DB_RANGE
+            if not low <= analysis["volume"]["db"] <= high:
+                reasons.append("volume")
+        if Config.ACCEPT_WPS_RANGE is not None:
+            low, high = Config.ACCEPT_WPS_RANGE
+            if not low <= analysis["speed"]["rate"] <= high:
+                reasons.append("speed")
+        confidence = analysis.get("confidence")
+        if Config.ACCEPT_MIN_CONFIDENCE is not None and confidence is not None \
+                and confidence < Config.ACCEPT_MIN_CONFIDENCE:
+            reasons.append("confidence")
+        return reasons
+
+    @staticmethod
+    def find_keyword_spans(words):
+        """在词级识别结果中查找关键词，返回 [{"keyword", "text", "start_ms", "end_ms"}, ...]
+
+        多词关键词要求各词连续出现；同一位置优先匹配词数更多的关键词，匹配结果互不重叠。
+        """
+        normalized = [re.sub(r'[^\w\s]', '', word["word"].lower()) for word in words]
+        keywords = sorted((keyword.lower().split() for keyword in Config.KEYWORDS), key=len, reverse=True)
+
+        spans = []
+        i = 0
+        while i < len(words):
+            for keyword_words in keywords:
+                if normalized[i:i + len(keyword_words)] == keyword_words:
+                    matched = words[i:i + len(keyword_words)]
+                    keyword_lower = " ".join(keyword_words)
+                    spans.append({
+                        "keyword": Config.KEYWORD_MAPPING.get(keyword_lower, keyword_lower),
+                        "text": " ".join(word["word"] for word in matched),
+                        "start_ms": matched[0]["start_ms"],
+                        "end_ms": matched[-1]["end_ms"]
+                    })
+                    i += len(keyword_words)
+                    break
+            else:
+                i += 1
+
+        logger.info(f"在 {len(words)} 个词中匹配到 {len(spans)} 个关键词")
+        return spans
+
+
+class SpeechGate:
+    """识别前的语音/非语音判定类
+
+    用谱平坦度、过零率和能量熵等廉价特征在本地判断片段是否包含语音，
+    咳嗽、点击声、背景噪声等片段可以不再请求ASR。
+    """
+
+    @staticmethod
+    def to_mono_float(audio):
+        """AudioSegment转换为[-1, 1]范围的单声道浮点采样"""
+        samples = SilenceDetector.get_samples(audio).astype(np.float64)
+        if audio.channels > 1:
+            samples = samples[:len(samples) - len(samples) % audio.channels].reshape(-1, audio.channels).mean(axis=1)
+        return samples / float(1 << (8 * audio.sample_width - 1))
+
+    @staticmethod
+    def extract_features(samples, frame_rate):
+        """分帧向量化计算特征
+
+        返回 {"voiced_ms": 有声帧时长, "flatness": 有声帧平均谱平坦度,
+        "zcr": 有声帧平均过零率, "entropy": 归一化能量熵}
+        """
+        frame_len = max(1, int(frame_rate * Config.GATE_FRAME_MS / 1000))
+        hop = max(1, int(frame_rate * Config.SILENCE_FRAME_MS / 1000))
+        if len(samples) < frame_len:
+            return {"voiced_ms": 0.0, "flatness": 1.0, "zcr": 0.0, "entropy": 1.0}
+
+        frames = np.lib.stride_tricks.sliding_window_view(samples, frame_len)[::hop]
+        energies = np.einsum("ij,ij->i", frames, frames) / frame_len
+        voiced = energies > db_to_float(Config.SILENCE_THRESH) ** 2
+        voiced_ms = float(np.count_nonzero(voiced) * hop * 1000 / frame_rate)
+        if not voiced.any():
+            return {"voiced_ms": 0.0, "flatness": 1.0, "zcr": 0.0, "entropy": 1.0}
+
+        voiced_frames = frames[voiced] * np.hanning(frame_len)
+        power = np.abs(np.fft.rfft(voiced_frames, axis=1)) ** 2 + 1e-12
+        flatness = np.exp(np.mean(np.log(power), axis=1)) / np.mean(power, axis=1)
+
+        signs = np.signbit(frames[voiced])
+        zcr = np.count_nonzero(signs[:, 1:] != signs[:, :-1], axis=1) / (frame_len - 1)
+
+        # 能量熵：能量在各帧上的分布越均匀（稳态噪声）越接近1，语音的能量起伏使其明显低于1
+        distribution = energies / energies.sum()
+        entropy = -np.sum(distribution * np.log(distribution + 1e-12)) / np.log(len(energies)) if len(energies) > 1 else 0.0
+
+        return {
+            "voiced_ms": voiced_ms,
+            "flatness": float(np.mean(flatness)),
+            "zcr": float(np.mean(zcr)),
+            "entropy": float(entropy)
+        }
+
+    @staticmethod
+    def classify(features):
+        """根据特征判断是否为语音，返回 (是否语音, 原因)"""
+        if features["voiced_ms"] < Config.GATE_MIN_VOICED_MS:
+            return False, "too_short"
+        if features["flatness"] > Config.GATE_MAX_FLATNESS:
+            return False, "flat_spectrum"
+        if features["zcr"] > Config.GATE_MAX_ZCR:
+            return False, "high_zcr"
+        if features["entropy"] > Config.GATE_MAX_ENTROPY:
+            return False, "stationary"
+        return True, "speech"
+
+    @staticmethod
+    @METRICS.measure("speech_gate")
+    def check(audio):
+        """判定AudioSegment片段，返回 {"speech": bool, "reason": 原因, "features": 特征}"""
+        features = SpeechGate.extract_features(SpeechGate.to_mono_float(audio), audio.frame_rate)
+        is_speech, reason = SpeechGate.classify(features)
+        return {"speech": is_speech, "reason": reason, "features": features}
+
+    @staticmethod
+    def evaluate(labeled_folder):
+        """在已标注的输出片段上评估判定效果
+
+        文件名中的关键词字段为Unknown的片段视为无需识别的片段，其余视为关键词片段。
+        返回被拦截的Unknown片段比例（节省的ASR请求）和被误拦截的关键词片段比例（召回损失）。
+        """
+        counts = Counter()
+        for path in sorted(Path(labeled_folder).rglob("*.wav")):
+            label = "unknown" if "_Unknown_" in path.name else "keyword"
+            decision = SpeechGate.check(AudioSegment.from_file(str(path)))
+            counts[label] += 1
+            if not decision["speech"]:
+                counts[f"{label}_gated"] += 1
+                logger.info(f"[拦截] {path.name}: {decision['reason']} {decision['features']}")
+
+        return {
+            "unknown": counts["unknown"],
+            "keyword": counts["keyword"],
+            "unknown_gated": counts["unknown_gated"],
+            "keyword_gated": counts["keyword_gated"],
+            "asr_saved_rate": counts["unknown_gated"] / counts["unknown"] if counts["unknown"] else 0.0,
+            "recall_loss": counts["keyword_gated"] / counts["keyword"] if counts["keyword"] else 0.0
+        }
+
+
+class TemplateLabeler:
+    """离线模板匹配关键词标注类
+
+    从已标注的片段中为每个关键词取若干参考模板，提取MFCC特征后用DTW与待标注片段比对。
+    所有模板补齐到相同长度后按反对角线向量化计算DTW，一个片段与全部模板的比对只需一次循环。
+    最佳距离足够小且明显优于其他关键词时才视为可信，否则交给ASR识别。
+    """
+
+    def __init__(self, template_folder, per_keyword=None):
+        """从template_folder递归加载模板，文件名中的关键词字段为标注结果(Unknown除外)"""
+        per_keyword = per_keyword or Config.TEMPLATES_PER_KEYWORD
+        known_keywords = set(Config.KEYWORD_MAPPING.values())
+
+        self.templates = []
+        self.labels = []
+        counts = Counter()
+        for path in sorted(Path(template_folder).rglob("*.wav")):
+            parts = path.stem.rsplit("_", 3)
+            keyword = parts[1] if len(parts) == 4 else None
+            if keyword not in known_keywords or counts[keyword] >= per_keyword:
+                continue
+            features = self.extract_features(AudioSegment.from_file(str(path)))
+            if features is None:
+                continue
+            self.templates.append(features)
+            self.labels.append(keyword)
+            counts[keyword] += 1
+
+        self.keywords = sorted(counts)
+        self.label_ids = np.array([self.keywords.index(label) for label in self.labels], dtype=np.int64)
+        logger.info(f"加载关键词模板 {len(self.templates)} 个: {dict(counts)}")
+
+        # 模板补齐到相同帧数，补齐部分距离为无穷大，不影响各模板自身终点的DTW结果
+        self.template_lengths = np.array([len(t) for t in self.templates], dtype=np.int64)
+        max_length = int(self.template_lengths.max()) if self.templates else 0
+        self.template_stack = np.zeros((len(self.templates), max_length, Config.TEMPLATE_N_MFCC))
+        self.template_mask = np.ones((len(self.templates), max_length), dtype=bool)
+        for i, template in enumerate(self.templates):
+            self.template_stack[i, :len(template)] = template
+            self.template_mask[i, :len(template)] = False
+
+    @staticmethod
+    def extract_features(audio):
+        """片段转换为去除首尾静音、按句做均值方差归一化的MFCC序列 (帧数, 维数)"""
+        samples = SpeechGate.to_mono_float(audio)
+        if audio.frame_rate != Config.TEMPLATE_SAMPLE_RATE:
+            samples = librosa.resample(samples, orig_sr=audio.frame_rate, target_sr=Config.TEMPLATE_SAMPLE_RATE)
+        samples, _ = librosa.effects.trim(samples, top_db=Config.TEMPLATE_TRIM_DB)
+        if len(samples) < Config.TEMPLATE_SAMPLE_RATE // 10:
+            return None
+
+        mfcc = librosa.feature.mfcc(y=samples, sr=Config.TEMPLATE_SAMPLE_RATE, n_mfcc=Config.TEMPLATE_N_MFCC,
+                                    n_fft=400, hop_length=160).T
+        return (mfcc - mfcc.mean(axis=0)) / (mfcc.std(axis=0) + 1e-8)
+
+    def dtw_distances(self, features):
+        """片段与全部模板的DTW距离（按路径长度n+m归一化）"""
+        n = len(features)
+        count, m = self.template_mask.shape
+
+        # 帧间欧氏距离 (模板数, n, m)
+        cost = np.sqrt(np.maximum(
+            np.sum(features ** 2, axis=1)[None, :, None]
+            + np.sum(self.template_stack ** 2, axis=2)[:, None, :]
+            - 2 * np.einsum("id,tjd->tij", features, self.template_stack), 0))
+        cost[np.broadcast_to(self.template_mask[:, None, :], cost.shape)] = np.inf
+
+        # 按反对角线 i+j=k 递推，同一对角线上的格子互不依赖，可一次向量化更新
+        acc = np.full((count, n + 1, m + 1), np.inf)
+        acc[:, 0, 0] = 0
+        for k in range(2, n + m + 1):
+            i = np.arange(max(1, k - m), min(n, k - 1) + 1)
+            j = k - i
+            best = np.minimum(np.minimum(acc[:, i - 1, j], acc[:, i, j - 1]), acc[:, i - 1, j - 1])
+            acc[:, i, j] = cost[:, i - 1, j - 1] + best
+
+        return acc[np.arange(count), n, self.template_lengths] / (n + self.template_lengths)
+
+    @METRICS.measure("offline_label")
+    def label(self, audio):
+        """标注片段，返回 {"keyword": 最佳关键词, "distance": 最佳距离, "margin": 最佳/次佳距离比, "confident": 是否可信}"""
+        features = self.extract_features(audio)
+        if features is None or not self.templates:
+            return {"keyword": None, "distance": float("inf"), "margin": 1.0, "confident": False}
+
+        distances = self.dtw_distances(features)
+        # 每个关键词取其模板中的最小距离
+        keyword_distances = np.full(len(self.keywords), np.inf)
+        np.minimum.at(keyword_distances, self.label_ids, distances)
+
+        order = np.argsort(keyword_distances)
+        best = keyword_distances[order[0]]
+        second = keyword_distances[order[1]] if len(order) > 1 else np.inf
+        margin = float(best / second) if np.isfinite(second) and second > 0 else 0.0
+        confident = bool(best <= Config.TEMPLATE_MAX_DISTANCE and margin <= Config.TEMPLATE_MAX_MARGIN)
+        return {"keyword": self.keywords[order[0]], "distance": float(best), "margin": margin, "confident": confident}
+
+
+class SilenceDetector:
+    """基于NumPy向量化分帧的静音检测类
+
+    与pydub.silence.split_on_silence语义一致：长度为MIN_SILENCE_LEN的窗口RMS低于
+    SILENCE_THRESH即视为静音。窗口同样以SILENCE_SEEK_MS(默认1毫秒)为步长滑动，
+    但窗口能量由每毫秒能量的前缀和一次性向量化求出，而不是逐毫秒切片计算RMS。
+    """
+
+    # 每次参与浮点运算的最大帧数，避免对整段长录音一次性转换为float64
+    ENERGY_BLOCK_FRAMES = 100000
+
+    @staticmethod
+    def get_samples(audio):
+        """获取AudioSegment的整型采样数组（多声道为交错排列）"""
+        return np.asarray(audio.get_array_of_samples())
+
+    @staticmethod
+    def frame_layout(frame_rate, channels, frame_ms=None):
+        """返回每帧采样数(含所有声道)与实际帧长(毫秒)
+
+        帧长按整数采样点取整，区间换算使用实际帧长，避免22.05kHz等采样率下的累计漂移。
+        """
+        frame_ms = frame_ms or Config.SILENCE_FRAME_MS
+        frame_samples = max(1, int(frame_rate * frame_ms / 1000))
+        return frame_samples * channels, frame_samples * 1000 / frame_rate
+
+    @staticmethod
+    def frame_energies(samples, samples_per_frame):
+        """计算每帧的均方能量，末尾不足一帧的采样不参与计算"""
+        num_frames = len(samples) // samples_per_frame
+        energies = np.empty(num_frames, dtype=np.float64)
+
+        block = SilenceDetector.ENERGY_BLOCK_FRAMES
+        for start in range(0, num_frames, block):
+            end = min(start + block, num_frames)
+            frames = samples[start * samples_per_frame:end * samples_per_frame]
+            frames = frames.reshape(end - start, samples_per_frame).astype(np.float64)
+            energies[start:end] = np.einsum('ij,ij->i', frames, frames) / samples_per_frame
+
+        return energies
+
+    @staticmethod
+    def seek_frame_count(num_frames, frame_rate, seek_ms):
+        """num_frames个采样帧中包含的完整步长帧数"""
+        return ((num_frames + 1) * 1000 - 1) // (seek_ms * frame_rate)
+
+    @staticmethod
+    def seek_bounds(first, last, frame_rate, channels, seek_ms):
+        """第first~last个步长帧边界对应的交错采样下标
+
+        与pydub按毫秒切片的取整方式(int(ms * frame_rate / 1000))一致，22.05kHz等采样率下
+        各帧采样数不等，但每个窗口覆盖的采样与pydub完全相同。
+        """
+        frames = np.arange(first, last + 1, dtype=np.int64)
+        return (frames * seek_ms * frame_rate // 1000) * channels
+
+    @staticmethod
+    def seek_frame_sums(samples, bounds):
+        """按边界计算每个步长帧的平方和，samples的第一个采样对应bounds[0]"""
+        num_frames = len(bounds) - 1
+        sums = np.empty(num_frames, dtype=np.float64)
+
+        block = SilenceDetector.ENERGY_BLOCK_FRAMES
+        for start in range(0, num_frames, block):
+            end = min(start + block, num_frames)
+            frames = samples[bounds[start] - bounds[0]:bounds[end] - bounds[0]].astype(np.float64)
+            sums[start:end] = np.add.reduceat(frames * frames, bounds[start:end] - bounds[start])
+
+        return sums
+
+    @staticmethod
+    def window_energies(sums, bounds, window_frames):
+        """由步长帧平方和求每个窗口的均方能量，第i个窗口由第i~i+window_frames-1帧组成"""
+        cumsum = np.concatenate(([0.0], np.cumsum(sums)))
+        counts = bounds[window_frames:len(sums) + 1] - bounds[:len(sums) + 1 - window_frames]
+        return (cumsum[window_frames:] - cumsum[:-window_frames]) / counts
+
+    @staticmethod
+    def silence_energy_threshold(silence_thresh, max_amplitude):
+        """静音窗口的均方能量上界(不含)
+
+        pydub比较的是截断为整数的RMS(audioop.rms)：int(sqrt(E)) <= T 等价于 E < (floor(T) + 1)^2。
+        """
+        return (math.floor(db_to_float(silence_thresh) * max_amplitude) + 1) ** 2
+
+    @staticmethod
+    def silent_frame_mask(energies, window_frames, thresh_energy):
+        """标记被任意静音窗口覆盖的帧
+
+        窗口由连续window_frames帧组成，窗口均方能量低于thresh_energy(由silence_energy_threshold得到)
+        即为静音窗口，与pydub中"窗口RMS <= 阈值"的判断等价。
+        """
+        num_frames = len(energies)
+        if num_frames < window_frames:
+            return np.zeros(num_frames, dtype=bool)
+
+        # 用前缀和一次性求出所有窗口的能量
+        cumsum = np.concatenate(([0.0], np.cumsum(energies)))
+        window_energy = (cumsum[window_frames:] - cumsum[:-window_frames]) / window_frames
+        return SilenceDetector.cover_windows(window_energy < thresh_energy, num_frames, window_frames)
+
+    @staticmethod
+    def cover_windows(silent_windows, num_frames, window_frames):
+        """标记被silent_windows中任意静音窗口覆盖的帧"""
+        silent_starts = np.flatnonzero(silent_windows)
+
+        # 差分数组展开窗口覆盖范围
+        coverage = np.zeros(num_frames + 1, dtype=np.int64)
+        np.add.at(coverage, silent_starts, 1)
+        np.add.at(coverage, silent_starts + window_frames, -1)
+        return np.cumsum(coverage[:-1]) > 0
+
+    @staticmethod
+    def mask_to_ranges(mask, frame_ms, total_ms):
+        """将静音帧标记转换为非静音区间列表 [[start_ms, end_ms], ...]"""
+        padded = np.concatenate(([True], mask, [True])).astype(np.int8)
+        edges = np.diff(padded)
+        starts = np.flatnonzero(edges == -1)
+        ends = np.flatnonzero(edges == 1)
+
+        ranges = []
+        for start, end in zip(starts, ends):
+            # 最后一帧为非静音时，末尾不足一帧的部分同样属于该片段
+            end_ms = total_ms if end == len(mask) else int(round(end * frame_ms))
+            ranges.append([int(round(start * frame_ms)), end_ms])
+        return ranges
+
+    @staticmethod
+    def apply_keep_silence(ranges, keep_silence, total_ms):
+        """为非静音区间两端保留静音，重叠部分从中间平分（与split_on_silence一致）"""
+        output_ranges = [[start - keep_silence, end + keep_silence] for start, end in ranges]
+
+        for range_i, range_ii in zip(output_ranges, output_ranges[1:]):
+            last_end = range_i[1]
+            next_start = range_ii[0]
+            if next_start < last_end:
+                range_i[1] = (last_end + next_start) // 2
+                range_ii[0] = range_i[1]
+
+        return [(max(start, 0), min(end, total_ms)) for start, end in output_ranges]
+
+    @staticmethod
+    def detect_nonsilent_numpy(audio, min_silence_len, silence_thresh, frame_ms=None):
+        """向量化检测非静音区间，窗口以frame_ms(默认SILENCE_SEEK_MS)为步长滑动"""
+        total_ms = len(audio)
+
+        frame_ms = int(frame_ms or Config.SILENCE_SEEK_MS)
+        window_frames = max(1, int(round(min_silence_len / frame_ms)))
+        thresh_energy = SilenceDetector.silence_energy_threshold(silence_thresh, audio.max_possible_amplitude)
+
+        num_frames = SilenceDetector.seek_frame_count(int(audio.frame_count()), audio.frame_rate, frame_ms)
+        if num_frames < window_frames:
+            return SilenceDetector.mask_to_ranges(np.zeros(num_frames, dtype=bool), frame_ms, total_ms)
+
+        bounds = SilenceDetector.seek_bounds(0, num_frames, audio.frame_rate, audio.channels, frame_ms)
+        sums = SilenceDetector.seek_frame_sums(SilenceDetector.get_samples(audio), bounds)
+        window_energy = SilenceDetector.window_energies(sums, bounds, window_frames)
+        mask = SilenceDetector.cover_windows(window_energy < thresh_energy, num_frames, window_frames)
+        return SilenceDetector.mask_to_ranges(mask, frame_ms, total_ms)
+
+    @staticmethod
+    def detect_nonsilent_indexed(energy_index, total_ms, min_silence_len, silence_thresh):
+        """使用已建立的能量索引检测非静音区间，不再重新扫描采样（索引帧长需不超过SILENCE_SEEK_MS）"""
+        window_frames = max(1, int(round(min_silence_len / energy_index.frame_ms)))
+        thresh_energy = SilenceDetector.silence_energy_threshold(silence_thresh, energy_index.max_amplitude)
+
+        mask = SilenceDetector.silent_frame_mask(energy_index.energies(), window_frames, thresh_energy)
+        return SilenceDetector.mask_to_ranges(mask, energy_index.frame_ms, total_ms)
+
+    @staticmethod
+    @METRICS.measure("silence_detect")
+    def detect_spans(audio, engine=None, min_silence_len=None, silence_thresh=None, keep_silence=None,
+                     energy_index=None):
+        """返回按静音分割后的片段区间 [(start_ms, end_ms), ...]，numpy引擎可复用能量索引"""
+        engine = engine or Config.SILENCE_ENGINE
+        min_silence_len = Config.MIN_SILENCE_LEN if min_silence_len is None else min_silence_len
+        silence_thresh = Config.SILENCE_THRESH if silence_thresh is None else silence_thresh
+        keep_silence = Config.KEEP_SILENCE if keep_silence is None else keep_silence
+
+        # 能量索引按SILENCE_FRAME_MS分帧，比窗口步长粗时窗口位置会偏离pydub，仍需按毫秒重新计算
+        if engine == "numpy" and energy_index is not None and \
+                energy_index.frame_ms <= Config.SILENCE_SEEK_MS:
+            ranges = SilenceDetector.detect_nonsilent_indexed(energy_index, len(audio), min_silence_len,
+                                                              silence_thresh)
+        elif engine == "numpy":
+            ranges = SilenceDetector.detect_nonsilent_numpy(audio, min_silence_len, silence_thresh)
+        elif engine == "pydub":
+            ranges = silence.detect_nonsilent(audio, min_silence_len=min_silence_len,
+                                              silence_thresh=silence_thresh)
+        else:
+            raise ValueError(f"未知的静音检测引擎: {engine}")
+
+        return SilenceDetector.apply_keep_silence(ranges, keep_silence, len(audio))
+
+    @staticmethod
+    def compare_engines(audio, tolerance_ms=None):
+        """对比numpy与pydub引擎的分割结果，用于验证切换引擎是否安全"""
+        tolerance_ms = Config.SILENCE_FRAME_MS if tolerance_ms is None else tolerance_ms
+
+        numpy_spans = SilenceDetector.detect_spans(audio, engine="numpy")
+        pydub_spans = SilenceDetector.detect_spans(audio, engine="pydub")
+
+        max_deviation = 0
+        if len(numpy_spans) == len(pydub_spans):
+            for (start_a, end_a), (start_b, end_b) in zip(numpy_spans, pydub_spans):
+                max_deviation = max(max_deviation, abs(start_a - start_b), abs(end_a - end_b))
+        matched = len(numpy_spans) == len(pydub_spans) and max_deviation <= tolerance_ms
+
+        logger.info(f"静音检测引擎对比: numpy {len(numpy_spans)} 个片段, pydub {len(pydub_spans)} 个片段, "
+                    f"最大边界偏差 {max_deviation}ms, {'一致' if matched else '不一致'}")
+        return {
+            "matched": matched,
+            "numpy_spans": numpy_spans,
+            "pydub_spans": pydub_spans,
+            "max_deviation_ms": max_deviation
+        }
+
+
+class EnergyIndex:
+    """录音能量前缀和索引
+
+    解码时按SILENCE_FRAME_MS分帧计算一次能量，保存能量、有声帧能量和有声帧数的前缀和，
+    之后任意区间的RMS/dBFS（包括只统计有声帧的语音响度）都是O(1)查询，不再重复扫描采样。
+    流式解码时可以逐块追加。
+    """
+
+    def __init__(self, frame_rate, channels, sample_width=2, frame_ms=None, voiced_thresh=None):
+        """初始化空索引，voiced_thresh为有声帧的dBFS阈值，默认使用SILENCE_THRESH"""
+        self.frame_rate = frame_rate
+        self.channels = channels
+        self.samples_per_frame, self.frame_ms = SilenceDetector.frame_layout(frame_rate, channels, frame_ms)
+        self.max_amplitude = float(1 << (8 * sample_width - 1))
+
+        voiced_thresh = Config.SILENCE_THRESH if voiced_thresh is None else voiced_thresh
+        self.voiced_energy = (db_to_float(voiced_thresh) * self.max_amplitude) ** 2
+
+        # 前缀和数组按容量倍增，第0个元素恒为0
+        self._size = 0
+        self._energy_cumsum = np.zeros(1024, dtype=np.float64)
+        self._voiced_cumsum = np.zeros(1024, dtype=np.float64)
+        self._voiced_count = np.zeros(1024, dtype=np.int64)
+        self._remainder = np.empty(0, dtype=np.int16)
+
+    @classmethod
+    @METRICS.measure("energy_index")
+    def from_audio(cls, audio, frame_ms=None):
+        """由完整解码的AudioSegment建立索引"""
+        index = cls(audio.frame_rate, audio.channels, audio.sample_width, frame_ms)
+        index.append_samples(SilenceDetector.get_samples(audio))
+        return index
+
+    @property
+    def num_frames(self):
+        """已建立索引的帧数"""
+        return self._size
+
+    def append_samples(self, samples):
+        """追加一块采样，末尾不足一帧的部分留到下一块"""
+        samples = np.concatenate((self._remainder, samples)) if len(self._remainder) else samples
+        energies = SilenceDetector.frame_energies(samples, self.samples_per_frame)
+        self._remainder = samples[len(energies) * self.samples_per_frame:]
+        self.append_energies(energies)
+        return energies
+
+    def append_energies(self, energies):
+        """追加已计算好的帧能量"""
+        needed = self._size + len(energies) + 1
+        if needed > len(self._energy_cumsum):
+            capacity = max(needed, 2 * len(self._energy_cumsum))
+            for name in ("_energy_cumsum", "_voiced_cumsum", "_voiced_count"):
+                grown = np.zeros(capacity, dtype=getattr(self, name).dtype)
+                grown[:self._size + 1] = getattr(self, name)[:self._size + 1]
+                setattr(self, name, grown)
+
+        voiced = energies > self.voiced_energy
+        start = self._size + 1
+        end = start + len(energies)
+        self._energy_cumsum[start:end] = self._energy_cumsum[self._size] + np.cumsum(energies)
+        self._voiced_cumsum[start:end] = self._voiced_cumsum[self._size] + np.cumsum(np.where(voiced, energies, 0))
+        self._voiced_count[start:end] = self._voiced_count[self._size] + np.cumsum(voiced)
+        self._size += len(energies)
+
+    def ms_to_frame(self, ms):
+        """毫秒转换为帧序号（截断到已建立索引的范围）"""
+        return min(max(int(round(ms / self.frame_ms)), 0), self._size)
+
+    def frame_to_ms(self, frame):
+        """帧序号转换为毫秒"""
+        return int(round(frame * self.frame_ms))
+
+    def _frame_range(self, start_ms, end_ms):
+        """区间对应的帧范围，至少包含一帧"""
+        first = self.ms_to_frame(start_ms)
+        last = max(self.ms_to_frame(end_ms), min(first + 1, self._size))
+        return min(first, last), last
+
+    def energies(self, start_ms=0, end_ms=None):
+        """区间内每帧的均方能量"""
+        first, last = self._frame_range(start_ms, self.frame_to_ms(self._size) if end_ms is None else end_ms)
+        return np.diff(self._energy_cumsum[first:last + 1])
+
+    def span_mean_square(self, start_ms, end_ms):
+        """区间的均方能量"""
+        first, last = self._frame_range(start_ms, end_ms)
+        if last <= first:
+            return 0.0
+        return (self._energy_cumsum[last] - self._energy_cumsum[first]) / (last - first)
+
+    def _to_dbfs(self, mean_square):
+        """均方能量转换为dBFS（与AudioSegment.dBFS一致）"""
+        if mean_square <= 0:
+            return -float("inf")
+        return 10 * math.log10(mean_square / self.max_amplitude ** 2)
+
+    def span_dbfs(self, start_ms, end_ms):
+        """区间整体响度(dBFS)"""
+        return self._to_dbfs(self.span_mean_square(start_ms, end_ms))
+
+    def is_voiced(self, ms):
+        """ms处所在帧是否为有声帧"""
+        frame = min(self.ms_to_frame(ms), self._size - 1)
+        return frame >= 0 and self._voiced_count[frame + 1] > self._voiced_count[frame]
+
+    def span_voiced_ms(self, start_ms, end_ms):
+        """区间内有声帧的总时长(ms)"""
+        first, last = self._frame_range(start_ms, end_ms)
+        return (self._voiced_count[last] - self._voiced_count[first]) * self.frame_ms
+
+    def span_speech_dbfs(self, start_ms, end_ms):
+        """区间内有声帧的响度(dBFS)，不受首尾保留静音的稀释；没有有声帧时返回整体响度"""
+        first, last = self._frame_range(start_ms, end_ms)
+        count = self._voiced_count[last] - self._voiced_count[first]
+        if count == 0:
+            return self.span_dbfs(start_ms, end_ms)
+        return self._to_dbfs((self._voiced_cumsum[last] - self._voiced_cumsum[first]) / count)
+
+    def min_energy_cuts(self, start_ms, duration_ms, num_segments, min_len, max_len, smooth_ms):
+        """在区间内选取num_segments-1个切点(相对区间起点的毫秒)，使每段都在[min_len, max_len]之间
+
+        每个切点在允许窗口内取平滑能量最低的帧边界，平滑能量由前缀和一次性向量化计算；
+        窗口由剩余段数推出，保证后面的段都能满足长度限制。窗口窄于一帧时取窗口中点。
+        段数不可行(如min_len过大)时返回None。
+        """
+        energies = self.energies(start_ms, start_ms + duration_ms)
+        first = self.ms_to_frame(start_ms)
+        # 各帧边界相对区间起点的毫秒位置
+        positions = np.rint((first + np.arange(len(energies) + 1)) * self.frame_ms).astype(np.int64) - start_ms
+
+        # 以每个帧边界为中心的滑动平均能量
+        half = max(1, int(round(smooth_ms / self.frame_ms / 2)))
+        cumsum = np.concatenate(([0.0], np.cumsum(energies)))
+        boundaries = np.arange(len(energies) + 1)
+        lo = np.maximum(boundaries - half, 0)
+        hi = np.minimum(boundaries + half, len(energies))
+        smoothed = (cumsum[hi] - cumsum[lo]) / np.maximum(hi - lo, 1)
+
+        cuts = []
+        position = 0
+        for remaining in range(num_segments, 1, -1):
+            low = max(position + min_len, duration_ms - (remaining - 1) * max_len)
+            high = min(position + max_len, duration_ms - (remaining - 1) * min_len)
+            if low > high:
+                return None
+            first_candidate = int(np.searchsorted(positions, low, side='left'))
+            last_candidate = int(np.searchsorted(positions, high, side='right'))
+            if first_candidate < last_candidate:
+                best = first_candidate + int(np.argmin(smoothed[first_candidate:last_candidate]))
+                cut = int(positions[best])
+            else:
+                cut = (low + high) // 2
+            cuts.append(cut)
+            position = cut
+        return cuts
+
+
+class StreamingSilenceDetector:
+    """流式静音分割类
+
+    按块接收int16采样，跨块保留静音窗口状态，分割结果与SilenceDetector的numpy引擎一致。
+    只缓存尚未输出的片段及其前后的保留静音，峰值内存与录音总时长无关。
+    """
+
+    def __init__(self, frame_rate, channels, min_silence_len=None, silence_thresh=None,
+                 keep_silence=None, frame_ms=None, energy_index=None):
+        """初始化流式检测状态，energy_index不为None时同时把采样追加到该索引
+
+        frame_ms为静音窗口的滑动步长，默认SILENCE_SEEK_MS。
+        """
+        self.frame_rate = frame_rate
+        self.energy_index = energy_index
+        self.channels = channels
+        self.keep_silence = Config.KEEP_SILENCE if keep_silence is None else keep_silence
+
+        min_silence_len = Config.MIN_SILENCE_LEN if min_silence_len is None else min_silence_len
+        silence_thresh = Config.SILENCE_THRESH if silence_thresh is None else silence_thresh
+
+        self.frame_ms = int(frame_ms or Config.SILENCE_SEEK_MS)
+        self.window_frames = max(1, int(round(min_silence_len / self.frame_ms)))
+        self.thresh_energy = SilenceDetector.silence_energy_threshold(silence_thresh, 32768)
+
+        # 采样缓冲区及其第一个采样在整段录音中的位置
+        self._buffer = np.empty(0, dtype=np.int16)
+        self._buffer_start = 0
+        self._total_samples = 0
+
+        # 尚未参与窗口计算的帧平方和，第一个元素对应第 _next_window 帧
+        self._sums = np.empty(0, dtype=np.float64)
+        self._next_window = 0
+        self._last_silent_start = -self.window_frames - 1
+
+        # 当前非静音段的起始帧，以及等待确定结尾保留静音的区间 [start_ms, end_ms]
+        self._speech_start = None
+        self._pending = None
+
+    def _ms_to_sample(self, ms):
+        """毫秒转换为缓冲区中的交错采样下标"""
+        return int(ms * self.frame_rate / 1000) * self.channels
+
+    def _frame_to_ms(self, frame):
+        """帧序号转换为毫秒"""
+        return int(frame) * self.frame_ms
+
+    def _frame_bounds(self, first, last):
+        """第first~last帧边界对应的交错采样下标"""
+        return SilenceDetector.seek_bounds(first, last, self.frame_rate, self.channels, self.frame_ms)
+
+    def _frames_done(self):
+        """已接收采样中包含的完整帧数"""
+        return SilenceDetector.seek_frame_count(
+            self._total_samples // self.channels, self.frame_rate, self.frame_ms)
+
+    def _total_ms(self):
+        """已接收音频的时长(毫秒)"""
+        return int(round(self._total_samples / self.channels * 1000 / self.frame_rate))
+
+    def push(self, samples):
+        """送入一块采样，返回已确定的片段列表 [(start_ms, end_ms, AudioSegment), ...]"""
+        samples = np.asarray(samples, dtype=np.int16)
+        if len(samples) == 0:
+            return []
+
+        # 计算新增完整帧的平方和（上一块剩余的不足一帧的采样与本块拼接）
+        frames_done = self._frames_done()
+        self._buffer = np.concatenate((self._buffer, samples))
+        self._total_samples += len(samples)
+        bounds = self._frame_bounds(frames_done, self._frames_done())
+        new_sums = SilenceDetector.seek_frame_sums(self._buffer[bounds[0] - self._buffer_start:], bounds)
+        self._sums = np.concatenate((self._sums, new_sums))
+        if self.energy_index is not None:
+            self.energy_index.append_samples(samples)
+
+        # 评估所有已具备完整窗口的起始帧
+        num_windows = len(self._sums) - self.window_frames + 1
+        ranges = []
+        if num_windows > 0:
+            bounds = self._frame_bounds(self._next_window, self._next_window + len(self._sums))
+            window_energy = SilenceDetector.window_energies(self._sums, bounds, self.window_frames)
+            starts = np.arange(self._next_window, self._next_window + num_windows)
+            silent = window_energy < self.thresh_energy
+            ranges = self._finalize_frames(starts, silent)
+            self._next_window += num_windows
+            self._sums = self._sums[num_windows:]
+
+        return self._emit(ranges, final=False)
+
+    def finish(self):
+        """输入结束，返回剩余的片段"""
+        num_frames = len(self._sums)
+        starts = np.arange(self._next_window, self._next_window + num_frames)
+        ranges = self._finalize_frames(starts, np.zeros(num_frames, dtype=bool))
+
+        # 末尾不足一帧的采样跟随最后一帧的状态
+        if self._speech_start is not None:
+            ranges.append([self._frame_to_ms(self._speech_start), self._total_ms()])
+            self._speech_start = None
+
+        self._next_window += num_frames
+        self._sums = self._sums[num_frames:]
+        return self._emit(ranges, final=True)
+
+    def _finalize_frames(self, frames, silent_windows):
+        """确定一批帧的静音状态，返回其中已结束的非静音区间"""
+        if len(frames) == 0:
+            return []
+
+        # 帧f被静音窗口覆盖，当且仅当最近的静音窗口起点 j<=f 满足 j+W>f
+        last_silent = np.where(silent_windows, frames, self._last_silent_start)
+        last_silent = np.maximum.accumulate(np.maximum(last_silent, self._last_silent_start))
+        self._last_silent_start = int(last_silent[-1])
+        is_silent = last_silent > frames - self.window_frames
+
+        # 找出状态翻转的位置，结合上一批的状态得到完整区间
+        previous = np.array([self._speech_start is None])
+        edges = np.diff(np.concatenate((previous, is_silent)).astype(np.int8))
+        speech_starts = frames[np.flatnonzero(edges == -1)]
+        speech_ends = frames[np.flatnonzero(edges == 1)]
+
+        ranges = []
+        start_iter = iter(speech_starts)
+        if self._speech_start is not None:
+            open_start = self._speech_start
+        else:
+            open_start = next(start_iter, None)
+        for end in speech_ends:
+            ranges.append([self._frame_to_ms(open_start), self._frame_to_ms(end)])
+            open_start = next(start_iter, None)
+        self._speech_start = None if open_start is None else int(open_start)
+        return ranges
+
+    def _emit(self, ranges, final):
+        """为区间加上保留静音并切出音频，规则与split_on_silence一致"""
+        keep = self.keep_silence
+        spans = []
+        for start, end in ranges:
+            next_start = start - keep
+            if self._pending is None:
+                next_start = max(next_start, 0)
+            else:
+                last_end = self._pending[1] + keep
+                if next_start < last_end:
+                    last_end = (last_end + next_start) // 2
+                    next_start = last_end
+                spans.append((self._pending[0], last_end))
+            self._pending = [next_start, end]
+
+        # 后续区间不可能再与等待中的区间重叠时，提前输出
+        if self._speech_start is not None:
+            decided_ms = self._frame_to_ms(self._speech_start)
+        else:
+            decided_ms = self._frame_to_ms(self._next_window)
+        if self._pending is not None and (final or decided_ms - keep >= self._pending[1] + keep):
+            spans.append((self._pending[0], self._pending[1] + keep))
+            self._pending = None
+
+        total_ms = self._total_ms()
+        segments = []
+        for start, end in spans:
+            end = min(end, total_ms)
+            data = self._buffer[self._ms_to_sample(start) - self._buffer_start:
+                                self._ms_to_sample(end) - self._buffer_start]
+            segments.append((start, end, AudioSegment(
+                data=data.tobytes(),
+                sample_width=2,
+                frame_rate=self.frame_rate,
+                channels=self.channels
+            )))
+
+        # 丢弃不会再被任何片段使用的采样
+        keep_from_ms = decided_ms - keep
+        if self._pending is not None:
+            keep_from_ms = min(keep_from_ms, self._pending[0])
+        trim = self._ms_to_sample(max(keep_from_ms, 0)) - self._buffer_start
+        frames_done = self._frames_done()
+        frame_floor = int(self._frame_bounds(frames_done, frames_done)[0]) - self._buffer_start
+        trim = min(trim, frame_floor)
+        if trim > 0:
+            self._buffer = self._buffer[trim:]
+            self._buffer_start += trim
+
+        return segments
+
+
+class StagePipeline:
+    """三阶段有界队列流水线：解码 → 分析/识别 → 写出
+
+    解码阶段由一个线程迭代片段生成器（生成器本身是顺序的），分析和写出阶段各有独立的线程数。
+    阶段之间的队列有容量上限，下游处理不过来时上游阻塞（背压），内存中的片段数不超过
+    队列容量与各阶段线程数之和。记录每个阶段的忙碌时间和队列深度，用于定位瓶颈。
+    """
+
+    STAGES = ("decode", "analyze", "write")
+    QUEUES = ("decoded", "analyzed")
+
+    # 队列中的结束标记
+    _DONE = object()
+
+    def __init__(self, queue_size=None, analyze_workers=None, write_workers=None, profile=None):
+        """初始化各阶段线程数和队列容量，profile为ProfileSession时各阶段线程也纳入剖析"""
+        self.profile = profile
+        self.queue_size = max(1, queue_size or Config.PIPELINE_QUEUE_SIZE)
+        self.workers = {
+            "decode": 1,
+            "analyze": max(1, analyze_workers or Config.PIPELINE_ANALYZE_WORKERS or Config.ASR_CONCURRENCY),
+            "write": max(1, write_workers or Config.PIPELINE_WRITE_WORKERS)
+        }
+
+        self.stats = Counter()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._error = None
+
+    def _record(self, name, value):
+        """线程安全地累加统计"""
+        with self._lock:
+            self.stats[name] += value
+
+    def _fail(self, error):
+        """记录第一个异常并通知所有阶段停止"""
+        with self._lock:
+            if self._error is None:
+                self._error = error
+        self._stop.set()
+
+    def _put(self, q, name, value):
+        """放入队列，队列满时阻塞等待；流水线停止时放弃"""
+        self._record(f"{name}_depth_sum", q.qsize())
+        self._record(f"{name}_depth_samples", 1)
+        if q.full():
+            self._record(f"{name}_full", 1)
+        while not self._stop.is_set():
+            try:
+                q.put(value, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _get(self, q):
+        """从队列取出，流水线停止时返回结束标记"""
+        while not self._stop.is_set():
+            try:
+                return q.get(timeout=0.1)
+            except queue.Empty:
+                continue
+        return self._DONE
+
+    def run(self, source, write, analyze=None, stream_analyze=None):
+        """运行流水线，返回按输入顺序排列的写出结果
+
+        source为可迭代的输入项；analyze(item)逐项分析，由多个线程并发调用；
+        也可以传入stream_analyze(iterable)，在一个线程中把输入流转换为 (item, result) 流
+        （用于自身已并发的拼接识别）。write(item, result)写出并返回结果。
+        """
+        decoded = queue.Queue(maxsize=self.queue_size)
+        analyzed = queue.Queue(maxsize=self.queue_size)
+        outputs = {}
+        analyze_workers = 1 if stream_analyze is not None else self.workers["analyze"]
+        remaining_analyzers = [analyze_workers]
+
+        def decode_stage():
+            iterator = iter(source)
+            seq = 0
+            while not self._stop.is_set():
+                start = time.perf_counter()
+                item = next(iterator, self._DONE)
+                self._record("decode_busy", time.perf_counter() - start)
+                if item is self._DONE:
+                    break
+                self._record("decode_items", 1)
+                if not self._put(decoded, "decoded", (seq, item)):
+                    return
+                seq += 1
+            for _ in range(analyze_workers):
+                self._put(decoded, "decoded", self._DONE)
+
+        def finish_analyze():
+            with self._lock:
+                remaining_analyzers[0] -= 1
+                last = remaining_analyzers[0] == 0
+            if last:
+                for _ in range(self.workers["write"]):
+                    self._put(analyzed, "analyzed", self._DONE)
+
+        def analyze_stage():
+            while True:
+                entry = self._get(decoded)
+                if entry is self._DONE:
+                    break
+                seq, item = entry
+                start = time.perf_counter()
+                result = analyze(item)
+                self._record("analyze_busy", time.perf_counter() - start)
+                self._record("analyze_items", 1)
+                if not self._put(analyzed, "analyzed", (seq, item, result)):
+                    return
+            finish_analyze()
+
+        def stream_analyze_stage():
+            # 忙碌时间 = 取下一个结果的总耗时 - 等待解码队列的时间
+            waiting = [0.0]
+
+            def inputs():
+                while True:
+                    start = time.perf_counter()
+                    entry = self._get(decoded)
+                    waiting[0] += time.perf_counter() - start
+                    if entry is self._DONE:
+                        return
+                    yield entry[1]
+
+            results = iter(stream_analyze(inputs()))
+            seq = 0
+            while True:
+                start, waited = time.perf_counter(), waiting[0]
+                entry = next(results, self._DONE)
+                self._record("analyze_busy", time.perf_counter() - start - (waiting[0] - waited))
+                if entry is self._DONE:
+                    break
+                self._record("analyze_items", 1)
+                if not self._put(analyzed, "analyzed", (seq,) + tuple(entry)):
+                    return
+                seq += 1
+            finish_analyze()
+
+        def write_stage():
+            while True:
+                entry = self._get(analyzed)
+                if entry is self._DONE:
+                    break
+                seq, item, result = entry
+                start = time.perf_counter()
+                output = write(item, result)
+                self._record("write_busy", time.perf_counter() - start)
+                self._record("write_items", 1)
+                with self._lock:
+                    outputs[seq] = output
+
+        def guarded(stage):
+            def target():
+                try:
+                    stage()
+                except BaseException as e:
+                    self._fail(e)
+            return self.profile.thread_profile(target) if self.profile is not None else target
+
+        threads = [threading.Thread(target=guarded(decode_stage), name="pipeline-decode")]
+        analyze_target = stream_analyze_stage if stream_analyze is not None else analyze_stage
+        threads += [threading.Thread(target=guarded(analyze_target), name=f"pipeline-analyze-{i}")
+                    for i in range(analyze_workers)]
+        threads += [threading.Thread(target=guarded(write_stage), name=f"pipeline-write-{i}")
+                    for i in range(self.workers["write"])]
+
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.stats["wall"] += time.perf_counter() - start
+
+        if self._error is not None:
+            raise self._error
+        return [outputs[seq] for seq in sorted(outputs)]
+
+    def counters(self):
+        """转换为AudioSplitter的运行计数（时间为毫秒整数，可跨文件、跨进程累加）"""
+        counters = Counter()
+        counters["pipeline_wall_ms"] = int(self.stats["wall"] * 1000)
+        for stage in self.STAGES:
+            counters[f"pipeline_{stage}_busy_ms"] = int(self.stats[f"{stage}_busy"] * 1000)
+            counters[f"pipeline_{stage}_items"] = self.stats[f"{stage}_items"]
+            counters[f"pipeline_{stage}_worker_ms"] = int(self.stats["wall"] * 1000) * self.workers[stage]
+        for name in self.QUEUES:
+            for suffix in ("depth_sum", "depth_samples", "full"):
+                counters[f"pipeline_{name}_{suffix}"] = self.stats[f"{name}_{suffix}"]
+        return +counters
+
+
+class RunManifest:
+    """处理完成清单
+
+    每处理完一个输入文件，向输出文件夹的manifest.jsonl追加一行记录（文件哈希、参数、输出列表），
+    断点续跑时跳过哈希和参数都未变化且输出完整的文件。
+    内存中只保留每个文件的哈希、参数、输出路径和记录在清单中的位置，片段分析结果需要时再从清单读取。
+    """
+
+    # 影响输出结果的配置项，任一变化都需要重新处理
+    PARAM_KEYS = (
+        "SPEECH_LANGUAGE", "ASR_BACKEND", "ASR_PACKING", "SILENCE_ENGINE", "SILENCE_FRAME_MS", "SILENCE_SEEK_MS", "MIN_SILENCE_LEN",
+        "SILENCE_THRESH", "KEEP_SILENCE", "MIN_SEGMENT_DURATION", "MAX_SEGMENT_DURATION", "SEGMENTATION_MODE",
+        "WORD_CUT_MARGIN_MS", "VOLUME_HIGH_THRESHOLD", "VOLUME_LOW_THRESHOLD", "FAST_THRESHOLD",
+        "SLOW_THRESHOLD", "KEYWORDS", "KEYWORD_MAPPING", "SPLIT_STRATEGY", "SPLIT_ENERGY_WINDOW_MS",
+        "VOLUME_USE_SPEECH_DB", "SPEECH_GATE_MODE", "GATE_FRAME_MS", "GATE_MIN_VOICED_MS", "GATE_MAX_FLATNESS",
+        "GATE_MAX_ZCR", "GATE_MAX_ENTROPY", "OFFLINE_LABELER", "TEMPLATE_FOLDER", "TEMPLATES_PER_KEYWORD",
+        "TEMPLATE_MAX_DISTANCE", "TEMPLATE_MAX_MARGIN", "NORMALIZE_ON_DECODE", "SAMPLE_RATE", "CHANNELS",
+        "ACCEPT_REQUIRE_KEYWORD", "ACCEPT_DB_RANGE", "ACCEPT_WPS_RANGE", "ACCEPT_MIN_CONFIDENCE"
+    )
+    # 只在对应识别方式启用时影响输出的配置项
+    PACKING_PARAM_KEYS = ("PACK_SEPARATOR_MS", "PACK_MAX_DURATION_MS", "PACK_BOUNDARY_TOLERANCE_MS")
+    LOCAL_ASR_PARAM_KEYS = ("LOCAL_ASR_TRANSCRIPTS", "LOCAL_ASR_ERROR_RATE", "LOCAL_ASR_NO_MATCH_RATE")
+
+    def __init__(self, output_folder):
+        """读取已有清单，同一输入文件以最后一条记录为准"""
+        self.path = os.path.join(output_folder, Config.MANIFEST_FILENAME)
+        self.entries = {}
+        if os.path.exists(self.path):
+            with open(self.path, 'rb') as f:
+                offset = 0
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except (json.JSONDecodeError, UnicodeDecodeError):
+                        # 崩溃时可能留下不完整的最后一行
+                        entry = None
+                    if entry is not None:
+                        self.entries[entry["input_file"]] = self.summarize_entry(entry, offset)
+                    offset += len(line)
+
+    @staticmethod
+    def summarize_entry(entry, offset):
+        """内存中保留的精简记录，offset为该记录在清单文件中的字节位置"""
+        return {
+            "sha256": entry["sha256"],
+            "params": entry["params"],
+            "outputs": entry["outputs"],
+            "offset": offset
+        }
+
+    @staticmethod
+    def file_hash(file_path):
+        """分块计算文件的SHA256"""
+        digest = hashlib.sha256()
+        with open(file_path, 'rb') as f:
+            for block in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(block)
+        return digest.hexdigest()
+
+    @staticmethod
+    def current_params(spk_id):
+        """当前影响输出的参数"""
+        keys = list(RunManifest.PARAM_KEYS)
+        if Config.ASR_PACKING:
+            keys.extend(RunManifest.PACKING_PARAM_KEYS)
+        if Config.ASR_BACKEND == "local":
+            keys.extend(RunManifest.LOCAL_ASR_PARAM_KEYS)
+        params = {key: getattr(Config, key) for key in keys}
+        params["spk_id"] = spk_id
+        return params
+
+    def find_completed(self, file_path, file_hash, spk_id):
+        """返回文件的完成记录；文件或参数有变化、输出缺失时返回None"""
+        entry = self.entries.get(file_path)
+        if entry is None or entry["sha256"] != file_hash:
+            return None
+        if entry["params"] != json.loads(json.dumps(self.current_params(spk_id))):
+            return None
+        if not all(os.path.exists(path) for path in entry["outputs"]):
+            return None
+        return entry
+
+    def load_saved_files(self, entry):
+        """从清单文件中读取完成记录的片段信息(saved_files)"""
+        with open(self.path, 'rb') as f:
+            f.seek(entry["offset"])
+            return json.loads(f.readline())["saved_files"]
+
+    def record(self, result, file_hash, spk_id):
+        """追加一条完成记录并立即落盘"""
+        entry = {
+            "input_file": result["input_file"],
+            "sha256": file_hash,
+            "params": self.current_params(spk_id),
+            "outputs": [file_info["path"] for file_info in result["saved_files"]],
+            "saved_files": result["saved_files"],
+            "completed_at": time.strftime('%Y-%m-%d %H:%M:%S')
+        }
+        with open(self.path, 'ab') as f:
+            offset = f.tell()
+            f.write((json.dumps(entry, ensure_ascii=False) + "\n").encode('utf-8'))
+            f.flush()
+            os.fsync(f.fileno())
+        self.entries[entry["input_file"]] = self.summarize_entry(entry, offset)
+
+
+class RejectLog:
+    """未保存片段的记录
+
+    不满足保存条件的片段只在输出文件夹的rejects.jsonl中追加一行（录音路径、起止毫秒、分析结果），
+    需要时可按偏移从原录音中重新切出，不写出音频文件。
+    """
+
+    def __init__(self, output_folder):
+        """打开(追加)记录文件"""
+        self.path = os.path.join(output_folder, Config.REJECTS_FILENAME)
+        self._lock = threading.Lock()
+
+    def record(self, file_path, spk_id, start_ms, end_ms, analysis, reasons):
+        """追加一条记录"""
+        entry = {
+            "input_file": file_path,
+            "spk_id": spk_id,
+            "start_ms": start_ms,
+            "end_ms": end_ms,
+            "reasons": reasons,
+            "keyword": analysis["keyword"],
+            "text": analysis["text"],
+            "confidence": analysis.get("confidence"),
+            "volume_db": round(analysis["volume"]["db"], 2),
+            "speech_rate": round(analysis["speed"]["rate"], 2)
+        }
+        line = json.dumps(entry, ensure_ascii=False) + "\n"
+        with self._lock:
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(line)
+
+
+class BatchStats:
+    """批处理统计汇总
+
+    每保存一个片段就增量更新关键词、音量、语速计数和固定分箱的dB/wps直方图（可在多个写出线程中调用），
+    重名检查使用Counter，不需要保留全部结果；定期把统计写入输出文件夹的stats.json并输出进度。
+    """
+
+    def __init__(self, output_folder=None, flush_seconds=None):
+        """初始化计数，output_folder为None时不写出统计文件"""
+        self.path = os.path.join(output_folder, Config.STATS_FILENAME) if output_folder else None
+        self.flush_seconds = Config.STATS_FLUSH_SECONDS if flush_seconds is None else flush_seconds
+
+        self.total_files = 0
+        self.files = 0
+        self.segments = 0
+        self.keywords = Counter()
+        self.volume_levels = Counter({"high": 0, "normal": 0, "low": 0})
+        self.speed_levels = Counter({"fast": 0, "normal": 0, "slow": 0})
+        self.filenames = Counter()
+        self.duplicates = 0
+
+        self.db_bins = Config.STATS_DB_BINS
+        self.wps_bins = Config.STATS_WPS_BINS
+        self.db_histogram = [0] * (self.bin_count(self.db_bins) + 2)
+        self.wps_histogram = [0] * (self.bin_count(self.wps_bins) + 2)
+
+        self.start_time = time.time()
+        self._last_flush = self.start_time
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def bin_count(bins):
+        """分箱数 (起点, 终点, 宽度)"""
+        start, stop, step = bins
+        return int(round((stop - start) / step))
+
+    @staticmethod
+    def bin_index(value, bins):
+        """值所在分箱的下标，0为下溢箱，最后一个为上溢箱"""
+        start, _, step = bins
+        index = int(math.floor((value - start) / step)) + 1
+        return min(max(index, 0), BatchStats.bin_count(bins) + 1)
+
+    def begin(self, total_files):
+        """开始处理，记录待处理文件总数"""
+        self.total_files = total_files
+
+    def update(self, result):
+        """合并一个文件的处理结果（片段未在保存时逐个合并的文件，如断点续跑跳过的文件）"""
+        for file_info in result['saved_files']:
+            self.add_segment(file_info)
+        self.finish_file()
+
+    def add_segment(self, file_info):
+        """合并一个已保存片段的信息"""
+        analysis = file_info['analysis']
+        with self._lock:
+            self.segments += 1
+            self.keywords[analysis['keyword']] += 1
+            self.volume_levels[analysis['volume']['level']] += 1
+            self.speed_levels[analysis['speed']['level']] += 1
+            self.db_histogram[self.bin_index(analysis['volume']['db'], self.db_bins)] += 1
+            self.wps_histogram[self.bin_index(analysis['speed']['rate'], self.wps_bins)] += 1
+
+            # 检查文件名冲突
+            filename = os.path.basename(file_info['path'])
+            self.filenames[filename] += 1
+            if self.filenames[filename] > 1:
+                self.duplicates += 1
+        self.maybe_flush()
+
+    def finish_file(self):
+        """记录一个文件处理完成"""
+        with self._lock:
+            self.files += 1
+        self.maybe_flush()
+
+    def maybe_flush(self):
+        """距上次写出超过flush_seconds时输出进度并写出统计文件"""
+        with self._lock:
+            now = time.time()
+            if now - self._last_flush < self.flush_seconds:
+                return
+            self._last_flush = now
+            self.report_progress()
+            self.flush()
+
+    def elapsed(self):
+        """已用时间(秒)"""
+        return time.time() - self.start_time
+
+    def report_progress(self):
+        """输出当前进度"""
+        elapsed = self.elapsed()
+        rate = self.files / elapsed if elapsed > 0 else 0
+        remaining = (self.total_files - self.files) / rate if rate > 0 else 0
+        logger.info(f"进度: {self.files}/{self.total_files} 个文件, {self.segments} 个片段, "
+                    f"{rate:.2f} 文件/秒, 预计剩余 {remaining:.0f} 秒")
+
+    def histogram_dict(self, histogram, bins):
+        """直方图转换为 [{"low", "high", "count"}, ...]，首尾为下溢/上溢箱（开放的一端为None）"""
+        start, stop, step = bins
+        edges = [None] + [start + i * step for i in range(self.bin_count(bins) + 1)] + [None]
+        return [{"low": low, "high": high, "count": count}
+                for low, high, count in zip(edges[:-1], edges[1:], histogram)]
+
+    def to_dict(self):
+        """可写出为JSON的统计"""
+        return {
+            "total_files": self.total_files,
+            "files": self.files,
+            "segments": self.segments,
+            "elapsed_sec": round(self.elapsed(), 2),
+            "keywords": dict(self.keywords),
+            "volume_levels": dict(self.volume_levels),
+            "speed_levels": dict(self.speed_levels),
+            "duplicate_filenames": self.duplicates,
+            "db_histogram": self.histogram_dict(self.db_histogram, self.db_bins),
+            "wps_histogram": self.histogram_dict(self.wps_histogram, self.wps_bins)
+        }
+
+    def flush(self):
+        """写出统计文件（先写临时文件再替换，读取方不会看到写了一半的文件）"""
+        if self.path is None:
+            return
+        temp_path = self.path + ".tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.to_dict(), f, ensure_ascii=False, indent=2)
+        os.replace(temp_path, self.path)
+
 
 class AudioSplitter:
     """音频分割类"""
@@ -215,14 +2410,63 @@ class AudioSplitter:
         self.input_folder = input_folder or Config.INPUT_FOLDER
         self.output_folder = output_folder or Config.OUTPUT_FOLDER
 
-        # 初始化语音识别器
-        self.recognizer = SpeechRecognizer()
-
         # 确保输出文件夹存在
         os.makedirs(self.output_folder, exist_ok=True)
 
-        # 临时文件列表，用于跟踪并在处理完成后删除
-        self.temp_files = []
+        # 初始化识别结果缓存和并发语音识别执行器
+        asr_cache = None
+        if Config.ASR_CACHE_ENABLED:
+            asr_cache = AsrCache(Config.ASR_CACHE_PATH or os.path.join(self.output_folder, "asr_cache.sqlite"))
+        self.asr_executor = AsrExecutor(cache=asr_cache)
+
+        # 各录音的能量索引，分析完成后释放
+        self.energy_indexes = {}
+
+        # 不满足保存条件的片段记录
+        self.reject_log = RejectLog(self.output_folder)
+
+        # 全部文件的阶段耗时汇总，以及当前文件的性能剖析
+        self.run_metrics = StageMetrics()
+        self.metrics_path = os.path.join(self.output_folder, Config.METRICS_FILENAME)
+        self.profile_session = None
+        # 批处理统计(BatchStats)，设置后每保存一个片段即合并到统计中
+        self.segment_stats = None
+
+        # 运行计数（打包识别等），多进程时由各进程汇总
+        self.counters = Counter()
+        self._counter_lock = threading.Lock()
+        self.packer = SegmentPacker(self.asr_executor, self.count)
+
+        # 离线关键词模板标注器
+        self.template_labeler = None
+        if Config.OFFLINE_LABELER:
+            self.template_labeler = TemplateLabeler(Config.TEMPLATE_FOLDER or self.output_folder)
+
+    def count(self, name, value=1):
+        """线程安全地累加计数"""
+        with self._counter_lock:
+            self.counters[name] += value
+
+    def counter_snapshot(self):
+        """当前计数（含识别缓存命中统计）"""
+        with self._counter_lock:
+            snapshot = Counter(self.counters)
+        cache = self.asr_executor.cache
+        if cache is not None:
+            snapshot["cache_hits"] = cache.hits
+            snapshot["cache_misses"] = cache.misses
+        return snapshot
+
+    def merge_counters(self, delta):
+        """合并工作进程返回的计数增量"""
+        cache = self.asr_executor.cache
+        for name, value in delta.items():
+            if name == "cache_hits" and cache is not None:
+                cache.hits += value
+            elif name == "cache_misses" and cache is not None:
+                cache.misses += value
+            else:
+                self.count(name, value)
 
     def get_audio_files(self):
         """获取所有音频文件路径"""
@@ -231,7 +2475,8 @@ class AudioSplitter:
             for file in files:
                 if file.endswith(('.wav', '.mp3', '.m4a', '.wav.mp3', '.wav.m4a')):
                     audio_files.append(os.path.join(root, file))
-        return audio_files
+        # 排序保证说话人编号与文件系统遍历顺序无关
+        return sorted(audio_files)
 
     def extract_file_info(self, filename):
         """从文件名提取信息"""
@@ -267,34 +2512,195 @@ class AudioSplitter:
                 "age": "00"
             }
 
-    def split_audio(self, audio_path):
-        """根据静音分割音频"""
-        logger.info(f"分割音频: {audio_path}")
+    def load_audio(self, audio_path):
+        """完整解码音频文件"""
+        # 解码时转换格式：复用分块解码，直接得到目标格式的PCM
+        if Config.NORMALIZE_ON_DECODE:
+            data = bytearray()
+            frame_rate, channels = Config.SAMPLE_RATE, Config.CHANNELS
+            for samples, frame_rate, channels in self.iter_audio_blocks(audio_path):
+                data += samples.astype('<i2').tobytes()
+            return AudioSegment(bytes(data), frame_rate=frame_rate, sample_width=2, channels=channels)
+
+        # 直接加载任何格式的音频
+        if audio_path.endswith('.mp3'):
+            return AudioSegment.from_mp3(audio_path)
+        elif audio_path.endswith('.m4a'):
+            return AudioSegment.from_file(audio_path, format="m4a")
+        elif audio_path.endswith('.wav'):
+            return AudioSegment.from_wav(audio_path)
+        else:
+            return AudioSegment.from_file(audio_path)
 
-        try:
-            # 直接加载任何格式的音频
-            if audio_path.endswith('.mp3'):
-                audio = AudioSegment.from_mp3(audio_path)
-            elif audio_path.endswith('.m4a'):
-                audio = AudioSegment.from_file(audio_path, format="m4a")
-            elif audio_path.endswith('.wav'):
-                audio = AudioSegment.from_wav(audio_path)
-            else:
-                audio = AudioSegment.from_file(audio_path)
-
-            # 根据静音分割
-            chunks = silence.split_on_silence(
-                audio,
-                min_silence_len=Config.MIN_SILENCE_LEN,
-                silence_thresh=Config.SILENCE_THRESH,
-                keep_silence=Config.KEEP_SILENCE
-            )
+    def iter_audio_blocks(self, audio_path, normalize=None):
+        """分块解码音频文件，逐块返回 (int16采样数组, 采样率, 声道数)
+
+        normalize为True（默认取NORMALIZE_ON_DECODE）时解码结果统一为SAMPLE_RATE、CHANNELS声道：
+        ffmpeg管道直接输出目标格式，WAV直读时在进程内下混并流式重采样。
+        """
+        normalize = Config.NORMALIZE_ON_DECODE if normalize is None else normalize
 
-            logger.info(f"初步分割为 {len(chunks)} 个片段")
+        # 16位PCM的WAV直接分块读取；wave模块不支持的WAV(WAVE_FORMAT_EXTENSIBLE、24/32位等)
+        # 与原来一样由pydub读取，不依赖ffmpeg；其他格式通过ffmpeg管道解码为16位PCM
+        if audio_path.endswith('.wav'):
+            try:
+                wav_file = wave.open(audio_path, 'rb')
+            except wave.Error as e:
+                logger.debug(f"wave模块无法读取 {audio_path} ({e})，改用pydub")
+                wav_file = None
+            if wav_file is not None:
+                with wav_file:
+                    if wav_file.getsampwidth() == 2:
+                        blocks = self.iter_wav_blocks(wav_file)
+                        yield from (self.normalize_blocks(blocks) if normalize else blocks)
+                        return
+            blocks = self.iter_segment_blocks(audio_path)
+            yield from (self.normalize_blocks(blocks) if normalize else blocks)
+            return
+
+        command = [get_encoder_name(), '-v', 'error', '-i', audio_path,
+                   '-f', 's16le', '-acodec', 'pcm_s16le']
+        if normalize:
+            # 输出格式由参数指定，无需探测源文件
+            frame_rate, channels = Config.SAMPLE_RATE, Config.CHANNELS
+            command += ['-ac', str(channels), '-ar', str(frame_rate)]
+        else:
+            info = mediainfo(audio_path)
+            frame_rate = int(info['sample_rate'])
+            channels = int(info['channels'])
+        command.append('-')
+        block_bytes = int(Config.STREAM_BLOCK_SECONDS * frame_rate) * channels * 2
+
+        # 错误输出写入临时文件：损坏的长文件会持续输出错误信息，管道写满后ffmpeg与读取方会互相等待
+        with tempfile.TemporaryFile() as stderr_file:
+            process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=stderr_file)
+            try:
+                while True:
+                    with METRICS.timed("decode") as timer:
+                        data = process.stdout.read(block_bytes)
+                        timer.nbytes = len(data)
+                    if not data:
+                        break
+                    # 保证每块为完整的采样帧
+                    data = data[:len(data) - len(data) % (2 * channels)]
+                    yield np.frombuffer(data, dtype='<i2'), frame_rate, channels
+            finally:
+                process.stdout.close()
+                process.wait()
+                if process.returncode:
+                    stderr_file.seek(0)
+                    raise RuntimeError(f"ffmpeg解码失败: {stderr_file.read().decode(errors='ignore')}")
 
+    @staticmethod
+    def iter_wav_blocks(wav_file):
+        """分块读取16位PCM的WAV，逐块返回 (int16采样数组, 采样率, 声道数)"""
+        frame_rate = wav_file.getframerate()
+        channels = wav_file.getnchannels()
+        block_frames = int(Config.STREAM_BLOCK_SECONDS * frame_rate)
+        while True:
+            with METRICS.timed("decode") as timer:
+                data = wav_file.readframes(block_frames)
+                timer.nbytes = len(data)
+            if not data:
+                return
+            yield np.frombuffer(data, dtype='<i2'), frame_rate, channels
+
+    @staticmethod
+    def iter_segment_blocks(audio_path):
+        """用pydub完整读取WAV并转换为16位，分块返回 (int16采样数组, 采样率, 声道数)"""
+        with METRICS.timed("decode") as timer:
+            audio = AudioSegment.from_wav(audio_path).set_sample_width(2)
+            timer.nbytes = len(audio.raw_data)
+        samples = SilenceDetector.get_samples(audio).astype(np.int16)
+        block = int(Config.STREAM_BLOCK_SECONDS * audio.frame_rate) * audio.channels
+        for start in range(0, len(samples), block):
+            yield samples[start:start + block], audio.frame_rate, audio.channels
+
+    @staticmethod
+    def normalize_blocks(blocks):
+        """在进程内把解码块转换为SAMPLE_RATE、CHANNELS声道
+
+        下混按声道取平均，重采样使用soxr的流式接口（与librosa.resample默认的soxr_hq相同质量），
+        滤波器状态跨块保留，分块结果与整段重采样一致。
+        """
+        target_rate, target_channels = Config.SAMPLE_RATE, Config.CHANNELS
+        resampler = None
+        for samples, frame_rate, channels in blocks:
+            if channels != target_channels:
+                frames = samples.reshape(-1, channels)
+                if target_channels == 1:
+                    samples = np.round(frames.mean(axis=1)).astype(np.int16)
+                else:
+                    # 单声道复制为多声道，其他情况取前target_channels个声道
+                    samples = np.ascontiguousarray(np.repeat(frames, target_channels, axis=1)
+                                                   if channels == 1 else frames[:, :target_channels]).reshape(-1)
+            if frame_rate == target_rate:
+                yield samples, target_rate, target_channels
+                continue
+
+            if resampler is None:
+                resampler = soxr.ResampleStream(frame_rate, target_rate, target_channels, dtype='int16')
+            with METRICS.timed("resample", samples.nbytes):
+                resampled = resampler.resample_chunk(samples.reshape(-1, target_channels) if target_channels > 1
+                                                     else samples)
+            if len(resampled):
+                yield resampled.reshape(-1), target_rate, target_channels
+
+        if resampler is not None:
+            tail = resampler.resample_chunk(np.zeros((0, target_channels) if target_channels > 1 else 0,
+                                                     dtype=np.int16), last=True)
+            if len(tail):
+                yield tail.reshape(-1), target_rate, target_channels
+
+    def iter_spans_streaming(self, audio_path):
+        """流式解码并分割音频，逐个返回 (start_ms, AudioSegment)"""
+        detector = None
+        for samples, frame_rate, channels in self.iter_audio_blocks(audio_path):
+            if detector is None:
+                energy_index = EnergyIndex(frame_rate, channels)
+                self.energy_indexes[audio_path] = energy_index
+                detector = StreamingSilenceDetector(frame_rate, channels, energy_index=energy_index)
+            with METRICS.timed("silence_detect", samples.nbytes):
+                spans = detector.push(samples)
+            for start, _, chunk in spans:
+                yield start, chunk
+
+        if detector is not None:
+            for start, _, chunk in detector.finish():
+                yield start, chunk
+
+    def iter_spans_in_memory(self, audio_path):
+        """完整解码后分割音频，逐个返回 (start_ms, AudioSegment)"""
+        audio = self.load_audio(audio_path)
+
+        # 解码后建立一次能量索引，静音检测和后续的响度分析都复用它
+        energy_index = EnergyIndex.from_audio(audio)
+        self.energy_indexes[audio_path] = energy_index
+
+        # 根据静音分割
+        spans = SilenceDetector.detect_spans(audio, energy_index=energy_index)
+        logger.info(f"初步分割为 {len(spans)} 个片段")
+
+        for start, end in spans:
+            yield start, audio[start:end]
+
+    def iter_chunks(self, audio_path, streaming=None):
+        """根据静音分割音频，逐个返回时长合格的 (start_ms, AudioSegment)
+
+        流式模式下分块解码并以生成器方式交给后续的分析/保存阶段，内存占用与录音时长无关。
+        """
+        streaming = Config.STREAMING_MODE if streaming is None else streaming
+        logger.info(f"分割音频: {audio_path} ({'流式' if streaming else '整段'}模式)")
+
+        if streaming:
+            spans = self.iter_spans_streaming(audio_path)
+        else:
+            spans = self.iter_spans_in_memory(audio_path)
+
+        total = 0
+        try:
             # 处理分割结果
-            processed_chunks = []
-            for i, chunk in enumerate(chunks):
+            for i, (start, chunk) in enumerate(spans):
                 # 检查片段时长
                 if len(chunk) < Config.MIN_SEGMENT_DURATION:
                     logger.debug(f"片段 {i + 1} 太短，跳过 ({len(chunk)}ms < {Config.MIN_SEGMENT_DURATION}ms)")
@@ -303,228 +2709,812 @@ class AudioSplitter:
                 # 如果片段太长，进一步分割
                 if len(chunk) > Config.MAX_SEGMENT_DURATION:
                     logger.debug(f"片段 {i + 1} 太长，进一步分割 ({len(chunk)}ms > {Config.MAX_SEGMENT_DURATION}ms)")
-                    sub_chunks = self.split_long_chunk(chunk)
-                    processed_chunks.extend(sub_chunks)
+                    energy_index = self.energy_indexes.get(audio_path)
+                    for offset, sub_chunk in self.split_long_chunk(chunk, start, energy_index):
+                        yield offset, sub_chunk
+                        total += 1
                 else:
-                    processed_chunks.append(chunk)
-
-            logger.info(f"处理后得到 {len(processed_chunks)} 个有效片段")
-            return processed_chunks
+                    yield start, chunk
+                    total += 1
 
         except Exception as e:
+            # 解码或分割失败时必须向上抛出，否则该文件会被当作已完成记入清单，断点续跑时不再重试
             logger.error(f"分割音频失败: {str(e)}")
-            return []
+            raise
 
-    def split_long_chunk(self, chunk):
-        """将长音频片段进一步分割"""
-        sub_chunks = []
+        logger.info(f"处理后得到 {total} 个有效片段")
+
+    def split_audio(self, audio_path):
+        """根据静音分割音频，返回 [(start_ms, AudioSegment), ...]，可直接传给save_chunks"""
+        return list(self.iter_chunks(audio_path, streaming=False))
+
+    @METRICS.measure("split_long_chunk")
+    def split_long_chunk(self, chunk, start_ms=0, energy_index=None):
+        """将长音频片段进一步分割，返回 [(起始ms, 子片段), ...]
+
+        SPLIT_STRATEGY为"energy"时切点放在允许范围内能量最低处，避免把关键词从中间切开；
+        提供能量索引时直接查询索引，并跳过完全没有有声帧的子片段，避免把纯静音送去识别。
+        """
         chunk_duration = len(chunk)
 
         # 计算需要分割成几个片段
         num_segments = (chunk_duration + Config.MAX_SEGMENT_DURATION - 1) // Config.MAX_SEGMENT_DURATION
         segment_duration = chunk_duration // num_segments
+        equal_cuts = [i * segment_duration for i in range(1, num_segments)]
+
+        cuts = equal_cuts
+        if Config.SPLIT_STRATEGY == "energy":
+            energy_cuts = self.find_energy_cuts(chunk, start_ms, energy_index, num_segments)
+            if self.valid_split_cuts(energy_cuts, chunk_duration, num_segments):
+                cuts = energy_cuts
+            else:
+                logger.warning(f"能量切点不满足长度限制，改用等分: {energy_cuts} ({chunk_duration}ms)")
+            self.count_split_cuts(equal_cuts, cuts, chunk, start_ms, energy_index)
 
         # 分割
-        for i in range(num_segments):
-            start = i * segment_duration
-            end = min((i + 1) * segment_duration, chunk_duration)
-            sub_chunk = chunk[start:end]
-            sub_chunks.append(sub_chunk)
+        sub_chunks = []
+        bounds = [0] + cuts + [chunk_duration]
+        for start, end in zip(bounds[:-1], bounds[1:]):
+            if energy_index is not None and energy_index.span_voiced_ms(start_ms + start, start_ms + end) == 0:
+                logger.debug(f"子片段 {start_ms + start}-{start_ms + end}ms 没有有声帧，跳过")
+                continue
+            sub_chunks.append((start_ms + start, chunk[start:end]))
 
         return sub_chunks
 
-    def analyze_audio_segment(self, audio_chunk):
-        """分析音频片段，识别关键词、音量和语速"""
-        # 创建临时文件
-        with tempfile.NamedTemporaryFile(suffix='.wav', delete=False) as temp_file:
-            temp_path = temp_file.name
-            self.temp_files.append(temp_path)
+    @staticmethod
+    def chunk_energy_index(chunk):
+        """没有录音级能量索引时，为单个片段临时建立索引"""
+        return EnergyIndex.from_audio(chunk)
 
-            # 保存音频片段到临时文件
-            audio_chunk.export(temp_path, format="wav")
+    def find_energy_cuts(self, chunk, start_ms, energy_index, num_segments):
+        """在片段内按能量最低处选取num_segments-1个切点，返回相对片段起点的毫秒列表（不可行时返回None）"""
+        if energy_index is None:
+            energy_index, start_ms = self.chunk_energy_index(chunk), 0
+        return energy_index.min_energy_cuts(start_ms, len(chunk), num_segments, Config.MIN_SEGMENT_DURATION,
+                                            Config.MAX_SEGMENT_DURATION, Config.SPLIT_ENERGY_WINDOW_MS)
 
-            # 分析音量
-            volume_level, volume_db = AudioAnalyzer.analyze_volume(temp_path)
+    @staticmethod
+    def valid_split_cuts(cuts, duration_ms, num_segments):
+        """检查切点：段数与等分相同，切点递增，各段长度都在MIN/MAX_SEGMENT_DURATION之间且总长等于片段时长"""
+        if cuts is None or len(cuts) != num_segments - 1:
+            return False
+        bounds = [0] + list(cuts) + [duration_ms]
+        lengths = [end - start for start, end in zip(bounds[:-1], bounds[1:])]
+        return sum(lengths) == duration_ms and \
+            all(Config.MIN_SEGMENT_DURATION <= length <= Config.MAX_SEGMENT_DURATION for length in lengths)
+
+    def count_split_cuts(self, equal_cuts, cuts, chunk, start_ms, energy_index):
+        """统计切点落在有声帧上的情况
+
+        等分切点落在有声帧上（从词中间切开）时，两侧子片段大概率识别为Unknown，识别费用白花；
+        能量切点避开了这类切点时，按受影响的子片段数估算节省的ASR请求。
+        """
+        if energy_index is None:
+            energy_index, start_ms = self.chunk_energy_index(chunk), 0
+        equal_voiced = {i for i, cut in enumerate(equal_cuts) if energy_index.is_voiced(start_ms + cut)}
+        voiced = {i for i, cut in enumerate(cuts) if energy_index.is_voiced(start_ms + cut)}
+
+        # 受等分有声切点影响、而能量切点下不受影响的子片段（切点i两侧为子片段i和i+1）
+        equal_affected = {j for i in equal_voiced for j in (i, i + 1)}
+        affected = {j for i in voiced for j in (i, i + 1)}
+
+        self.count("split_cuts", len(cuts))
+        self.count("split_cuts_in_speech", len(voiced))
+        self.count("split_equal_cuts_in_speech", len(equal_voiced))
+        self.count("split_asr_saved", max(len(equal_affected) - len(affected), 0))
+
+    def label_offline(self, audio_chunk, context=None):
+        """离线模板标注，返回可信时的识别文本（关键词原文），否则返回None
+
+        可信的标注按TEMPLATE_AUDIT_RATE抽样同时请求ASR，统计两者的一致率；
+        不可信的标注仍会请求ASR，调用方用record_offline_agreement记录最佳猜测是否与ASR一致。
+        """
+        if self.template_labeler is None:
+            return None
 
-            # 语音识别
-            recognized_text = self.recognizer.recognize_from_file(temp_path)
+        result = self.template_labeler.label(audio_chunk)
+        self.count("offline_checked")
+        logger.debug(f"离线标注: {result}")
+        if not result["confident"]:
+            if context is not None:
+                context["offline_guess"] = result["keyword"]
+            return None
 
-            # 分析语速
-            duration_sec = len(audio_chunk) / 1000  # 毫秒转秒
-            speed_level, speech_rate = AudioAnalyzer.analyze_speech_rate(recognized_text, duration_sec)
+        self.count("offline_hits")
+        text = next(phrase for phrase, code in Config.KEYWORD_MAPPING.items() if code == result["keyword"])
+
+        # 按片段内容决定是否抽检，多进程和重复运行时抽检的片段一致
+        digest = hashlib.md5(audio_chunk.raw_data).digest()
+        if int.from_bytes(digest[:4], "big") < Config.TEMPLATE_AUDIT_RATE * 2 ** 32:
+            asr_audio = audio_chunk.set_channels(1).set_sample_width(2)
+            asr_text = self.asr_executor.recognize_from_pcm(asr_audio.raw_data, asr_audio.frame_rate,
+                                                            context=context)
+            self.count("offline_audited")
+            if AudioAnalyzer.match_keyword(asr_text) == result["keyword"]:
+                self.count("offline_agreed")
+            else:
+                logger.info(f"离线标注与ASR不一致: {result['keyword']} / {asr_text}")
+        return text
+
+    def record_offline_agreement(self, context, matched_keyword):
+        """记录置信度不足的离线最佳猜测与ASR结果是否一致"""
+        if context is not None and "offline_guess" in context:
+            self.count("offline_fallbacks")
+            if context["offline_guess"] == matched_keyword:
+                self.count("offline_fallback_agreed")
+
+    @METRICS.measure("analyze_segment")
+    def analyze_audio_segment(self, audio_chunk, context=None):
+        """分析音频片段，识别关键词、音量和语速；context为片段来源信息"""
+        # 先尝试离线模板标注，置信度不足时再请求ASR
+        recognized_text = self.label_offline(audio_chunk, context)
+        confidence = None
+        if recognized_text is None:
+            # 语音识别，ASR输入统一为16位单声道PCM
+            asr_audio = audio_chunk.set_channels(1).set_sample_width(2)
+            result = self.asr_executor.recognize_pcm_result(asr_audio.raw_data, asr_audio.frame_rate,
+                                                            context=context)
+            recognized_text, confidence = result["text"], result.get("confidence")
+
+        # 匹配关键词
+        matched_keyword = AudioAnalyzer.match_keyword(recognized_text)
+        self.record_offline_agreement(context, matched_keyword)
+
+        return self.build_analysis(audio_chunk, recognized_text, matched_keyword, context, confidence)
+
+    def gate_chunks(self, chunks, file_path, decisions):
+        """识别前判定片段是否为语音，drop模式下过滤掉非语音片段，判定结果按起始ms记录到decisions"""
+        for start_ms, chunk in chunks:
+            decision = SpeechGate.check(chunk)
+            self.count("gate_checked")
+            if decision["speech"]:
+                self.count("gate_speech")
+            else:
+                self.count("gate_nonspeech")
+                self.count(f"gate_nonspeech_{decision['reason']}")
+            features = ", ".join(f"{name}={value:.3f}" for name, value in decision["features"].items())
+            logger.info(f"语音判定 {os.path.basename(file_path)} {start_ms}-{start_ms + len(chunk)}ms: "
+                        f"{decision['reason']} ({features})")
+
+            if not decision["speech"] and Config.SPEECH_GATE_MODE == "drop":
+                self.count("gate_dropped")
+                continue
+            decisions[start_ms] = decision
+            yield start_ms, chunk
 
-            # 匹配关键词
-            matched_keyword = AudioAnalyzer.match_keyword(recognized_text)
+    def save_chunks(self, chunks, file_path, spk_id):
+        """分析并保存分割后的音频片段，chunks为可迭代的 (start_ms, AudioSegment)
 
-            return {
-                "text": recognized_text,
-                "keyword": matched_keyword or "Unknown",
-                "volume": {
-                    "level": volume_level,
-                    "db": volume_db,
-                    "code": Config.VOLUME_MAPPING.get(volume_level, "N")
-                },
-                "speed": {
-                    "level": speed_level,
-                    "rate": speech_rate,
-                    "code": Config.SPEED_MAPPING.get(speed_level, "N")
-                }
-            }
+        解码(迭代chunks)、分析/识别、写出在有界队列流水线的不同阶段中并行进行。
+        """
+        gate_decisions = {}
+        if Config.SPEECH_GATE_MODE != "off":
+            chunks = self.gate_chunks(chunks, file_path, gate_decisions)
+
+        def analyze(item):
+            start_ms, chunk = item
+            context = {"source": file_path, "start_ms": start_ms, "end_ms": start_ms + len(chunk)}
+            return self.analyze_audio_segment(chunk, context)
 
-    def save_chunks(self, chunks, file_path, spk_id):
-        """保存分割后的音频片段"""
-        # 提取文件信息
         file_info = self.extract_file_info(file_path)
+        folder_path = self.speaker_folder(spk_id)
 
-        # 创建保存目录
+        export = self.ordered_exporter()
+
+        def write(item, analysis):
+            if Config.SPEECH_GATE_MODE != "off":
+                analysis["speech_gate"] = gate_decisions.pop(item[0])
+            return self.save_analyzed_chunk(item, analysis, folder_path, file_info, spk_id, file_path, export)
+
+        pipeline = StagePipeline(profile=self.profile_session)
+        if Config.ASR_PACKING:
+            # 拼接识别内部已并发，分析阶段只用一个线程驱动
+            saved_files = pipeline.run(chunks, write,
+                                       stream_analyze=lambda items: self.iter_packed_analysis(items, file_path))
+        else:
+            saved_files = pipeline.run(chunks, write, analyze=analyze)
+        saved_files = [saved for saved in saved_files if saved is not None]
+
+        pipeline_counters = pipeline.counters()
+        logger.info(f"流水线统计 {os.path.basename(file_path)}: {dict(pipeline_counters)}")
+        for name, value in pipeline_counters.items():
+            self.count(name, value)
+        return saved_files
+
+    def iter_packed_analysis(self, chunks, file_path):
+        """拼接识别片段，逐个返回 ((start_ms, AudioSegment), analysis)
+
+        离线标注可信的片段不参与拼接，按原顺序与识别结果合并输出。
+        等待输出的离线标注片段达到PIPELINE_QUEUE_SIZE时结束本轮拼接并输出全部结果，再开始下一轮，
+        避免离线标注片段在等待拼接结果时无限累积。
+        """
+        chunks = iter(chunks)
+        limit = max(1, Config.PIPELINE_QUEUE_SIZE)
+
+        # 按输入顺序排队的 (片段, 片段来源信息, 离线标注文本)
+        ordered = deque()
+        exhausted = [False]
+
+        def asr_items():
+            offline_count = 0
+            for start_ms, chunk in chunks:
+                context = {"source": file_path, "start_ms": start_ms, "end_ms": start_ms + len(chunk)}
+                offline_text = self.label_offline(chunk, context)
+                ordered.append(((start_ms, chunk), context, offline_text))
+                if offline_text is None:
+                    yield (start_ms, chunk), chunk, dict(context)
+                else:
+                    offline_count += 1
+                    if offline_count >= limit:
+                        return
+            exhausted[0] = True
+
+        def analyzed(item, context, text, confidence=None):
+            matched_keyword = AudioAnalyzer.match_keyword(text)
+            self.record_offline_agreement(context, matched_keyword)
+            return item, self.build_analysis(item[1], text, matched_keyword, context, confidence)
+
+        while not exhausted[0]:
+            for item, result in self.packer.recognize_items(asr_items()):
+                # 先输出排在该片段之前的离线标注片段
+                while ordered[0][2] is not None:
+                    yield analyzed(*ordered.popleft())
+                _, context, _ = ordered.popleft()
+                yield analyzed(item, context, result["text"], result.get("confidence"))
+
+            while ordered:
+                yield analyzed(*ordered.popleft())
+
+    def speaker_folder(self, spk_id):
+        """创建并返回说话人的保存目录"""
         folder_path = os.path.join(self.output_folder, f"SPK{spk_id:03d}")
         os.makedirs(folder_path, exist_ok=True)
+        return folder_path
 
-        saved_files = []
-        for i, chunk in enumerate(chunks):
-            # 分析音频
-            analysis = self.analyze_audio_segment(chunk)
+    @staticmethod
+    def export_chunk(chunk, output_path, start_ms=None):
+        """写出音频片段"""
+        with METRICS.timed("export", len(chunk.raw_data)):
+            chunk.export(output_path, format="wav")
+        logger.info(f"已保存: {output_path}")
 
-            # 创建序号
-            segment_num = f"{i + 1:03d}"
+    @staticmethod
+    def ordered_exporter():
+        """返回可由多个写出线程并发调用的export_chunk
+
+        不同片段可能得到相同的文件名（如Unknown片段的音量、语速相同），顺序写出时后一个片段覆盖前一个。
+        同一文件名的写出互斥，并且起始时间更早的片段不会覆盖已写出的更晚片段，
+        保证磁盘上的结果与线程调度无关、与顺序写出一致；不同文件名之间仍并行写出。
+        """
+        lock = threading.Lock()
+        path_locks = {}
+        latest = {}  # 输出路径 -> 已写出片段的起始毫秒
+
+        def export(chunk, output_path, start_ms):
+            with lock:
+                path_lock = path_locks.setdefault(output_path, threading.Lock())
+            with path_lock:
+                if latest.get(output_path, -1) > start_ms:
+                    logger.debug(f"{output_path} 已由更晚的片段写出，跳过 {start_ms}ms 处的片段")
+                    return
+                AudioSplitter.export_chunk(chunk, output_path)
+                latest[output_path] = start_ms
+
+        return export
+
+    def save_analyzed_chunk(self, item, analysis, folder_path, file_info, spk_id, file_path=None, export=None):
+        """保存一个已完成分析的音频片段，item为 (start_ms, AudioSegment)，返回保存的文件信息
+
+        不满足保存条件时不写出音频，按REJECT_ACTION记录或丢弃，返回None。
+        export为写出函数，默认export_chunk；多线程写出时使用ordered_exporter。
+        """
+        start_ms, chunk = item
+
+        reasons = AudioAnalyzer.check_acceptance(analysis)
+        if reasons:
+            self.count("rejected")
+            for reason in reasons:
+                self.count(f"rejected_{reason}")
+            logger.debug(f"片段 {start_ms}-{start_ms + len(chunk)}ms 不满足保存条件: {reasons}")
+            if Config.REJECT_ACTION == "log":
+                self.reject_log.record(file_path, spk_id, start_ms, start_ms + len(chunk), analysis, reasons)
+            return None
 
-            # 创建文件名，格式：SPK001_CAN_LONDON_MALE_29_HeyMemo_-15.2dB_2.4wps.wav
-            # 保留小数点后一位的音量(dB)和语速(单词/秒)
-            volume_str = f"{analysis['volume']['db']:.1f}dB"
-            speed_str = f"{analysis['speed']['rate']:.1f}wps"
-            filename = f"SPK{spk_id:03d}_{file_info['country']}_{file_info['city']}_{file_info['gender']}_{file_info['age']}_{analysis['keyword']}_{volume_str}_{speed_str}.wav"
-            output_path = os.path.join(folder_path, filename)
+        # 创建文件名，格式：SPK001_CAN_LONDON_MALE_29_HeyMemo_-15.2dB_2.4wps.wav
+        # 保留小数点后一位的音量(dB)和语速(单词/秒)
+        volume_str = f"{analysis['volume']['db']:.1f}dB"
+        speed_str = f"{analysis['speed']['rate']:.1f}wps"
+        filename = f"SPK{spk_id:03d}_{file_info['country']}_{file_info['city']}_{file_info['gender']}_{file_info['age']}_{analysis['keyword']}_{volume_str}_{speed_str}.wav"
+        output_path = os.path.join(folder_path, filename)
+
+        # 保存音频
+        (export or self.export_chunk)(chunk, output_path, start_ms)
+
+        # 扩展保存的文件信息，添加更多详细数据
+        saved = {
+            "path": output_path,
+            "analysis": analysis,
+            "volume_db": analysis['volume']['db'],
+            "speech_rate": analysis['speed']['rate'],
+            "filename": os.path.basename(output_path),
+            "start_ms": start_ms,
+            "end_ms": start_ms + len(chunk)
+        }
+        if self.segment_stats is not None:
+            self.segment_stats.add_segment(saved)
+        return saved
 
-            # 保存音频
-            chunk.export(output_path, format="wav")
-            # 扩展保存的文件信息，添加更多详细数据
-            saved_files.append({
-                "path": output_path,
-                "analysis": analysis,
-                "volume_db": analysis['volume']['db'],
-                "speech_rate": analysis['speed']['rate'],
-                "filename": os.path.basename(output_path)
-            })
+    def save_analyzed_chunks(self, analyzed, file_path, spk_id):
+        """保存已完成分析的音频片段，analyzed为可迭代的 ((start_ms, AudioSegment), analysis)"""
+        # 提取文件信息
+        file_info = self.extract_file_info(file_path)
 
-            logger.info(f"已保存: {output_path}")
+        # 创建保存目录
+        folder_path = self.speaker_folder(spk_id)
+
+        saved_files = (self.save_analyzed_chunk(item, analysis, folder_path, file_info, spk_id, file_path)
+                       for item, analysis in analyzed)
+        return [saved for saved in saved_files if saved is not None]
+
+    def iter_mono_pcm_blocks(self, audio_path):
+        """分块解码并转换为16位单声道PCM，逐块返回 (PCM字节, 采样率)，同时建立能量索引"""
+        energy_index = None
+        for samples, frame_rate, channels in self.iter_audio_blocks(audio_path):
+            if energy_index is None:
+                energy_index = EnergyIndex(frame_rate, channels)
+                self.energy_indexes[audio_path] = energy_index
+            energy_index.append_samples(samples)
+            if channels > 1:
+                samples = samples.reshape(-1, channels).mean(axis=1).astype(np.int16)
+            yield samples.astype('<i2').tobytes(), frame_rate
+
+    def iter_span_audio(self, audio_path, spans):
+        """流式解码录音，按起始时间顺序切出互不重叠的区间，逐个返回 (start_ms, AudioSegment)"""
+        spans = sorted(spans)
+        index = 0
+        buffer = np.empty(0, dtype=np.int16)
+        buffer_start = 0
+        frame_rate = channels = None
+
+        def cut(start, end):
+            first = int(start * frame_rate / 1000) * channels - buffer_start
+            last = int(end * frame_rate / 1000) * channels - buffer_start
+            data = buffer[max(first, 0):max(last, 0)]
+            return AudioSegment(data=data.tobytes(), sample_width=2, frame_rate=frame_rate, channels=channels)
+
+        for samples, frame_rate, channels in self.iter_audio_blocks(audio_path):
+            buffer = np.concatenate((buffer, samples))
+            buffer_end = buffer_start + len(buffer)
+
+            while index < len(spans) and int(spans[index][1] * frame_rate / 1000) * channels <= buffer_end:
+                yield spans[index][0], cut(*spans[index])
+                index += 1
+
+            # 丢弃下一个区间之前的采样
+            keep_from = buffer_end
+            if index < len(spans):
+                keep_from = min(keep_from, int(spans[index][0] * frame_rate / 1000) * channels)
+            if keep_from > buffer_start:
+                buffer = buffer[keep_from - buffer_start:]
+                buffer_start = keep_from
+
+        # 录音结尾处的区间按实际长度截断
+        while frame_rate is not None and index < len(spans):
+            yield spans[index][0], cut(*spans[index])
+            index += 1
+
+    def cut_keyword_spans(self, keyword_spans, total_ms=None):
+        """在关键词词边界外加上保留时长，相邻片段重叠时从中间平分"""
+        margin = Config.WORD_CUT_MARGIN_MS
+        spans = []
+        for keyword_span in keyword_spans:
+            start = max(0, int(keyword_span["start_ms"] - margin))
+            end = int(keyword_span["end_ms"] + margin)
+            if total_ms is not None:
+                end = min(end, total_ms)
+            if spans and start < spans[-1][1]:
+                middle = (start + spans[-1][1]) // 2
+                spans[-1][1] = middle
+                start = middle
+            spans.append([start, end])
+        return [tuple(span) for span in spans]
+
+    def process_file_continuous(self, file_path, spk_id):
+        """整段连续识别一次，按关键词词边界切分并保存"""
+        context = {"source": file_path}
+
+        # 第一遍：流式解码并送入连续识别
+        blocks = self.iter_mono_pcm_blocks(file_path)
+        first = next(blocks, None)
+        if first is None:
+            logger.warning(f"文件没有音频数据: {file_path}")
+            return []
+        sample_rate = first[1]
+        total_bytes = [0]
+
+        def pcm_blocks():
+            for data, _ in itertools.chain([first], blocks):
+                total_bytes[0] += len(data)
+                yield data
+
+        words = self.asr_executor.recognize_words(pcm_blocks(), sample_rate, context=context)
+        total_ms = int(total_bytes[0] / 2 * 1000 / sample_rate)
+
+        # 按关键词的首尾词边界确定切分区间
+        keyword_spans = AudioAnalyzer.find_keyword_spans(words)
+        cut_spans = self.cut_keyword_spans(keyword_spans, total_ms)
+
+        # 第二遍：流式解码切出关键词片段，识别结果直接来自连续识别
+        def analyzed():
+            for keyword_span, (start_ms, chunk) in zip(keyword_spans, self.iter_span_audio(file_path, cut_spans)):
+                chunk_context = dict(context, start_ms=start_ms, end_ms=start_ms + len(chunk))
+                yield (start_ms, chunk), self.build_analysis(chunk, keyword_span["text"], keyword_span["keyword"],
+                                                             chunk_context)
+
+        return self.save_analyzed_chunks(analyzed(), file_path, spk_id)
+
+    @METRICS.measure("volume")
+    def measure_volume(self, audio_chunk, context=None):
+        """查询片段响度，返回 (音量级别, 整体dBFS, 有声帧dBFS)
+
+        录音已建立能量索引时为O(1)查询，否则直接用片段采样计算。
+        """
+        energy_index = self.energy_indexes.get(context["source"]) if context else None
+        if energy_index is not None and "start_ms" in context:
+            volume_db = energy_index.span_dbfs(context["start_ms"], context["end_ms"])
+            speech_db = energy_index.span_speech_dbfs(context["start_ms"], context["end_ms"])
+            volume_level = AudioAnalyzer.classify_volume(speech_db if Config.VOLUME_USE_SPEECH_DB else volume_db)
+            logger.debug(f"片段音量为 {volume_db:.2f}dB (有声帧 {speech_db:.2f}dB), 级别: {volume_level}")
+            return volume_level, volume_db, speech_db
+
+        volume_level, volume_db = AudioAnalyzer.analyze_volume_segment(audio_chunk)
+        return volume_level, volume_db, volume_db
+
+    def build_analysis(self, audio_chunk, recognized_text, matched_keyword, context=None, confidence=None):
+        """根据识别文本和片段音频生成分析结果，confidence为ASR置信度（没有时为None）"""
+        volume_level, volume_db, speech_db = self.measure_volume(audio_chunk, context)
+        duration_sec = len(audio_chunk) / 1000  # 毫秒转秒
+        speed_level, speech_rate = AudioAnalyzer.analyze_speech_rate(recognized_text, duration_sec)
 
-        return saved_files
+        return {
+            "text": recognized_text,
+            "keyword": matched_keyword or "Unknown",
+            "confidence": confidence,
+            "volume": {
+                "level": volume_level,
+                "db": volume_db,
+                "speech_db": speech_db,
+                "code": Config.VOLUME_MAPPING.get(volume_level, "N")
+            },
+            "speed": {
+                "level": speed_level,
+                "rate": speech_rate,
+                "code": Config.SPEED_MAPPING.get(speed_level, "N")
+            }
+        }
 
+    @METRICS.measure("process_file")
     def process_file(self, file_path, spk_id):
         """处理单个文件"""
         logger.info(f"处理文件: {file_path}")
 
-        # 分割音频
-        chunks = self.split_audio(file_path)
+        # 指定的文件在性能剖析下处理，结果保存到输出文件夹
+        profile = contextlib.nullcontext()
+        if Config.PROFILE_FILE and os.path.basename(file_path) == Config.PROFILE_FILE:
+            profile = ProfileSession(os.path.join(self.output_folder, f"profile_{Path(file_path).stem}"))
 
-        # 保存分割后的音频
-        saved_files = self.save_chunks(chunks, file_path, spk_id)
+        with profile as self.profile_session:
+            try:
+                if Config.SEGMENTATION_MODE == "continuous":
+                    saved_files = self.process_file_continuous(file_path, spk_id)
+                else:
+                    # 分割音频（生成器，边分割边分析保存）
+                    chunks = self.iter_chunks(file_path)
+
+                    # 保存分割后的音频
+                    saved_files = self.save_chunks(chunks, file_path, spk_id)
+            finally:
+                self.energy_indexes.pop(file_path, None)
+                self.profile_session = None
 
         return {
             "input_file": file_path,
             "saved_files": saved_files
         }
 
-    def process_batch(self, spk_id_start=1):
-        """批量处理音频文件"""
+    def process_tracked_file(self, file_path, spk_id):
+        """处理单个文件，并在结果中附带输入文件哈希（供完成清单使用）和该文件的阶段耗时统计"""
+        # 丢弃上一个出错文件残留的统计
+        METRICS.drain()
+        with METRICS.timed("file_hash"):
+            file_hash = RunManifest.file_hash(file_path)
+        result = self.process_file(file_path, spk_id)
+        result["sha256"] = file_hash
+        result["metrics"] = METRICS.drain()
+        return result
+
+    def record_metrics(self, result):
+        """取出结果中的阶段耗时统计，写出该文件的记录并计入全部文件的汇总"""
+        stages = result.pop("metrics", None)
+        if not stages or not Config.METRICS_ENABLED:
+            return
+        self.write_metrics({"scope": "file", "file": result["input_file"]}, stages)
+        self.run_metrics.merge(stages)
+
+    def write_metrics(self, fields, stages):
+        """每个阶段一行JSON追加到metrics.jsonl"""
+        timestamp = time.strftime('%Y-%m-%d %H:%M:%S')
+        with open(self.metrics_path, 'a', encoding='utf-8') as f:
+            for entry in StageMetrics.summarize(stages):
+                f.write(json.dumps(dict(fields, time=timestamp, **entry), ensure_ascii=False) + "\n")
+
+    def finish_metrics(self):
+        """写出全部文件的汇总记录并返回汇总"""
+        stages = self.run_metrics.drain()
+        if stages:
+            self.write_metrics({"scope": "total", "file": None}, stages)
+        return StageMetrics.summarize(stages)
+
+    def clean_partial_outputs(self, spk_id):
+        """删除未完成文件留下的部分输出（每个输入文件独占一个SPK文件夹）"""
+        folder_path = os.path.join(self.output_folder, f"SPK{spk_id:03d}")
+        if not os.path.isdir(folder_path):
+            return
+
+        removed = 0
+        for filename in os.listdir(folder_path):
+            if filename.endswith('.wav'):
+                os.remove(os.path.join(folder_path, filename))
+                removed += 1
+        if removed:
+            logger.info(f"已清理 {folder_path} 中的 {removed} 个未完成输出")
+
+    def process_batch(self, spk_id_start=1, workers=None, resume=False, stats=None, keep_results=True):
+        """批量处理音频文件
+
+        spk_id按排序后的文件顺序分配；workers大于1时使用多进程并行处理，
+        结果仍按文件顺序合并，输出文件名与调度顺序无关。
+        resume为True时跳过清单中已完成的文件，并清理未完成文件的部分输出。
+        stats为BatchStats时更新统计：单进程时每保存一个片段即更新，多进程时在每个文件完成后合并；
+        keep_results为False时不保留结果，返回空列表。
+        """
+        workers = workers or Config.BATCH_WORKERS
         audio_files = self.get_audio_files()
         logger.info(f"发现 {len(audio_files)} 个音频文件")
+        if stats is not None:
+            stats.begin(len(audio_files))
+
+        def finished(audio_path, result, store, segments_counted=False):
+            if stats is not None:
+                if segments_counted:
+                    stats.finish_file()
+                else:
+                    stats.update(result)
+            if keep_results:
+                store[audio_path] = result
 
-        results = []
+        manifest = RunManifest(self.output_folder)
+        completed = {}
+        tasks = []
         for i, audio_path in enumerate(audio_files):
             spk_id = spk_id_start + i
+            if resume:
+                entry = manifest.find_completed(audio_path, RunManifest.file_hash(audio_path), spk_id)
+                if entry is not None:
+                    finished(audio_path, {"input_file": audio_path, "saved_files": manifest.load_saved_files(entry)},
+                             completed)
+                    continue
+                self.clean_partial_outputs(spk_id)
+            tasks.append((audio_path, spk_id))
+
+        if resume:
+            logger.info(f"断点续跑: 跳过 {len(audio_files) - len(tasks)} 个已完成文件, 待处理 {len(tasks)} 个文件")
+
+        if workers > 1 and len(tasks) > 1:
+            processed = self._process_batch_parallel(tasks, min(workers, len(tasks)), manifest, finished)
+        else:
+            processed = {}
+            self.segment_stats = stats
             try:
-                result = self.process_file(audio_path, spk_id)
-                results.append(result)
-            except Exception as e:
-                logger.error(f"处理文件 {audio_path} 时出错: {str(e)}")
+                for audio_path, spk_id in tasks:
+                    try:
+                        result = self.process_tracked_file(audio_path, spk_id)
+                    except Exception as e:
+                        logger.error(f"处理文件 {audio_path} 时出错: {str(e)}")
+                        continue
+                    self.record_metrics(result)
+                    manifest.record(result, result.pop("sha256"), spk_id)
+                    finished(audio_path, result, processed, segments_counted=True)
+            finally:
+                self.segment_stats = None
+
+        # 按文件顺序合并跳过的和新处理的结果
+        completed.update(processed)
+        return [completed[audio_path] for audio_path in audio_files if audio_path in completed]
+
+    def _process_batch_parallel(self, tasks, workers, manifest, finished):
+        """多进程处理文件列表，返回 {输入文件: 结果}，每完成一个文件调用 finished(输入文件, 结果, 结果字典)"""
+        logger.info(f"使用 {workers} 个进程并行处理")
+
+        # 每个进程独立限速，总速率与单进程配置保持一致
+        config = _config_snapshot()
+        config["ASR_RATE_LIMIT"] = Config.ASR_RATE_LIMIT / workers
+        config["ASR_RATE_BURST"] = max(1, Config.ASR_RATE_BURST // workers)
+
+        results = {}
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_batch_worker,
+                                 initargs=(self.input_folder, self.output_folder, config)) as executor:
+            futures = {executor.submit(_process_file_worker, audio_path, spk_id): (audio_path, spk_id)
+                       for audio_path, spk_id in tasks}
+            # 按完成顺序处理，处理过的Future立即释放，不在内存中保留全部结果
+            for future in as_completed(futures):
+                audio_path, spk_id = futures.pop(future)
+                try:
+                    result = future.result()
+                except Exception as e:
+                    logger.error(f"处理文件 {audio_path} 时出错: {str(e)}")
+                    continue
+                if result is None:
+                    continue
 
-        # 删除所有临时文件
-        self.cleanup_temp_files()
+                # 汇总各进程的计数和阶段耗时
+                self.merge_counters(result.pop("counters", {}))
+                self.record_metrics(result)
+
+                manifest.record(result, result.pop("sha256"), spk_id)
+                finished(audio_path, result, results)
 
         return results
 
-    def cleanup_temp_files(self):
-        """清理所有临时文件"""
-        logger.info(f"开始清理 {len(self.temp_files)} 个临时文件")
+    def close(self):
+        """释放识别线程池"""
+        self.asr_executor.shutdown()
 
-        for temp_file in self.temp_files:
-            try:
-                if os.path.exists(temp_file):
-                    os.remove(temp_file)
-                    logger.debug(f"已删除临时文件: {temp_file}")
-            except Exception as e:
-                logger.warning(f"删除临时文件失败: {temp_file}, 错误: {str(e)}")
 
-        # 清空临时文件列表
-        self.temp_files = []
-        logger.info("临时文件清理完成")
+# 多进程批处理的工作进程状态
+_worker_splitter = None
+
+
+def _config_snapshot():
+    """导出当前配置，传递给工作进程（Windows下子进程不会继承运行时修改的配置）"""
+    return {key: value for key, value in vars(Config).items() if key.isupper()}
+
+
+def _init_batch_worker(input_folder, output_folder, config):
+    """工作进程初始化：应用配置并创建本进程的分割器"""
+    global _worker_splitter
+    for key, value in config.items():
+        setattr(Config, key, value)
+    _worker_splitter = AudioSplitter(input_folder, output_folder)
+
+
+def _process_file_worker(file_path, spk_id):
+    """工作进程中处理单个文件"""
+    before = _worker_splitter.counter_snapshot()
+
+    try:
+        result = _worker_splitter.process_tracked_file(file_path, spk_id)
+    except Exception as e:
+        logger.error(f"处理文件 {file_path} 时出错: {str(e)}")
+        return None
+
+    result["counters"] = dict(_worker_splitter.counter_snapshot() - before)
+    return result
 
 
 # 执行批处理
-def run_batch_processing(input_folder=None, output_folder=None, spk_id_start=1):
-    """执行批处理"""
+def run_batch_processing(input_folder=None, output_folder=None, spk_id_start=1, resume=False, keep_results=True):
+    """执行批处理，resume为True时从上次中断处继续
+
+    统计在处理过程中增量汇总并定期写出；keep_results为False时不在内存中保留各文件的结果，返回空列表。
+    """
     logger.info("开始批量处理文件...")
 
     # 初始化分割器
     splitter = AudioSplitter(input_folder, output_folder)
+    stats = BatchStats(splitter.output_folder)
 
     # 执行批处理
-    results = splitter.process_batch(spk_id_start)
+    start_time = time.time()
+    try:
+        results = splitter.process_batch(spk_id_start, resume=resume, stats=stats, keep_results=keep_results)
+        elapsed = time.time() - start_time
+        cache_stats = splitter.asr_executor.cache.stats() if splitter.asr_executor.cache else None
+        counters = splitter.counter_snapshot()
+        stage_metrics = splitter.finish_metrics()
+    finally:
+        splitter.close()
+    stats.flush()
 
     # 汇总处理结果
-    total_files = len(results)
-    total_saved = sum(len(result['saved_files']) for result in results)
-
-    # 统计关键词识别
-    keyword_stats = {}
-    volume_stats = {"high": 0, "normal": 0, "low": 0}
-    speed_stats = {"fast": 0, "normal": 0, "slow": 0}
-
-    # 检查是否有文件名冲突
-    all_filenames = []
-    duplicates = []
-
-    for result in results:
-        for file_info in result['saved_files']:
-            # 关键词统计
-            keyword = file_info['analysis']['keyword']
-            if keyword in keyword_stats:
-                keyword_stats[keyword] += 1
-            else:
-                keyword_stats[keyword] = 1
-
-            # 音量和语速统计
-            volume_stats[file_info['analysis']['volume']['level']] += 1
-            speed_stats[file_info['analysis']['speed']['level']] += 1
-
-            # 检查文件名冲突
-            filename = os.path.basename(file_info['path'])
-            if filename in all_filenames:
-                duplicates.append(filename)
-            else:
-                all_filenames.append(filename)
+    total_files = stats.files
+    total_saved = stats.segments
 
     print("\n批处理结果汇总:")
     print(f"处理的文件总数: {total_files}")
     print(f"保存的文件总数: {total_saved}")
     print(f"平均每个文件的片段数: {total_saved / total_files if total_files > 0 else 0:.2f}")
+    print(f"处理耗时: {elapsed:.2f} 秒, 吞吐量: {total_saved / elapsed if elapsed > 0 else 0:.2f} 片段/秒")
 
     print("\n关键词识别统计:")
-    for keyword, count in sorted(keyword_stats.items(), key=lambda x: x[1], reverse=True):
+    for keyword, count in stats.keywords.most_common():
         print(f"{keyword}: {count} 个片段")
 
     print("\n音量分布统计:")
-    for level, count in volume_stats.items():
+    for level, count in stats.volume_levels.items():
         print(f"{level.capitalize()}: {count} 个片段")
 
     print("\n语速分布统计:")
-    for level, count in speed_stats.items():
+    for level, count in stats.speed_levels.items():
         print(f"{level.capitalize()}: {count} 个片段")
 
+    if cache_stats:
+        print("\n识别缓存统计:")
+        print(f"命中: {cache_stats['hits']} 次, 未命中: {cache_stats['misses']} 次, "
+              f"命中率: {cache_stats['hit_rate'] * 100:.1f}%, 缓存条目: {cache_stats['entries']}")
+
+    if counters["pack_requests"]:
+        packing_ratio = counters["packed_segments"] / counters["pack_requests"]
+        fallback_rate = counters["pack_fallbacks"] / counters["packed_segments"]
+        print("\n拼接识别统计:")
+        print(f"拼接请求: {counters['pack_requests']} 次, 拼接片段: {counters['packed_segments']} 个, "
+              f"拼接比: {packing_ratio:.1f} 片段/请求, 回退逐段识别: {counters['pack_fallbacks']} 个 "
+              f"({fallback_rate * 100:.1f}%)")
+
+    if counters["split_cuts"]:
+        print("\n长片段分割统计:")
+        print(f"切点: {counters['split_cuts']} 个, 落在语音中: {counters['split_cuts_in_speech']} 个 "
+              f"(等分时为 {counters['split_equal_cuts_in_speech']} 个), "
+              f"估计减少Unknown片段节省的ASR请求: {counters['split_asr_saved']} 次")
+
+    if counters["gate_checked"]:
+        reasons = ", ".join(f"{name[len('gate_nonspeech_'):]}: {count}" for name, count in sorted(counters.items())
+                            if name.startswith("gate_nonspeech_"))
+        print("\n语音判定统计:")
+        print(f"判定片段: {counters['gate_checked']} 个, 语音: {counters['gate_speech']} 个, "
+              f"非语音: {counters['gate_nonspeech']} 个 ({reasons or '无'}), "
+              f"未请求ASR而丢弃: {counters['gate_dropped']} 个")
+
+    if counters["offline_checked"]:
+        hit_rate = counters["offline_hits"] / counters["offline_checked"]
+        print("\n离线模板标注统计:")
+        print(f"标注片段: {counters['offline_checked']} 个, 离线命中: {counters['offline_hits']} 个 "
+              f"(命中率 {hit_rate * 100:.1f}%), 抽检: {counters['offline_audited']} 个, "
+              f"与ASR一致: {counters['offline_agreed']} 个")
+        if counters["offline_fallbacks"]:
+            print(f"置信度不足转ASR: {counters['offline_fallbacks']} 个, "
+                  f"其中最佳猜测与ASR一致: {counters['offline_fallback_agreed']} 个")
+
+    if stage_metrics:
+        print(f"\n阶段耗时统计 (详见 {Config.METRICS_FILENAME}):")
+        for entry in sorted(stage_metrics, key=lambda entry: entry["wall_sec"], reverse=True):
+            print(f"{entry['stage']}: {entry['count']} 次, 累计 {entry['wall_sec']:.2f} 秒, "
+                  f"p50/p95/p99 {entry['p50_ms']:.1f}/{entry['p95_ms']:.1f}/{entry['p99_ms']:.1f}ms"
+                  + (f", {entry['mb_per_sec']:.1f} MB/秒" if entry["bytes"] else ""))
+
+    if counters["rejected"]:
+        reasons = ", ".join(f"{name[len('rejected_'):]}: {count}" for name, count in sorted(counters.items())
+                            if name.startswith("rejected_"))
+        print("\n保存条件统计:")
+        print(f"未保存(未写出音频): {counters['rejected']} 个片段 ({reasons})"
+              + (f", 记录于 {Config.REJECTS_FILENAME}" if Config.REJECT_ACTION == "log" else ""))
+
+    if counters["pipeline_wall_ms"]:
+        print("\n流水线统计:")
+        for stage, label in (("decode", "解码"), ("analyze", "分析/识别"), ("write", "写出")):
+            busy_ms = counters[f"pipeline_{stage}_busy_ms"]
+            utilization = busy_ms / counters[f"pipeline_{stage}_worker_ms"] if counters[f"pipeline_{stage}_worker_ms"] else 0
+            print(f"{label}: 处理 {counters[f'pipeline_{stage}_items']} 个片段, 忙碌 {busy_ms / 1000:.2f} 秒, "
+                  f"线程利用率 {utilization * 100:.1f}%")
+        for name, label in (("decoded", "解码→分析"), ("analyzed", "分析→写出")):
+            samples = counters[f"pipeline_{name}_depth_samples"]
+            average_depth = counters[f"pipeline_{name}_depth_sum"] / samples if samples else 0
+            print(f"队列 {label}: 平均深度 {average_depth:.1f}, 队列满(上游阻塞) {counters[f'pipeline_{name}_full']} 次")
+
     # 检查是否有文件名冲突
-    if duplicates:
-        print(f"\n警告: 发现 {len(duplicates)} 个重复文件名!")
+    if stats.duplicates:
+        print(f"\n警告: 发现 {stats.duplicates} 个重复文件名!")
         print("现在使用音量(dB)和语速(wps)的具体数值，应该不会再有冲突")
 
     return results
@@ -532,10 +3522,35 @@ def run_batch_processing(input_folder=None, output_folder=None, spk_id_start=1):
 
 # 主程序入口
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="按静音分割录音并用ASR标注关键词")
+    parser.add_argument("--resume", action="store_true", help="跳过清单中已完成的文件，清理未完成文件的部分输出")
+    parser.add_argument("--profile", metavar="FILENAME",
+                        help="对指定的输入文件(文件名)做性能剖析，结果保存在输出文件夹")
+    parser.add_argument("--profile-tool", choices=["cProfile", "pyinstrument"], default=Config.PROFILE_TOOL,
+                        help="性能剖析工具")
+    parser.add_argument("--evaluate-gate", metavar="FOLDER",
+                        help="在已标注的输出片段文件夹上评估识别前语音判定（Unknown与关键词片段），不执行批处理")
+    args = parser.parse_args()
+
+    if args.evaluate_gate:
+        report = SpeechGate.evaluate(args.evaluate_gate)
+        print(f"Unknown片段: {report['unknown']} 个, 被拦截: {report['unknown_gated']} 个 "
+              f"(节省ASR请求 {report['asr_saved_rate'] * 100:.1f}%)")
+        print(f"关键词片段: {report['keyword']} 个, 被误拦截: {report['keyword_gated']} 个 "
+              f"(召回损失 {report['recall_loss'] * 100:.1f}%)")
+        raise SystemExit(0)
+
+    if args.profile:
+        Config.PROFILE_FILE = args.profile
+        Config.PROFILE_TOOL = args.profile_tool
+
     print(f"使用配置参数:")
     print(f"输入文件夹: {Config.INPUT_FOLDER}")
     print(f"输出文件夹: {Config.OUTPUT_FOLDER}")
-    print(f"语音识别服务: Azure ({Config.SPEECH_REGION})")
+    if Config.ASR_BACKEND == "azure":
+        print(f"语音识别服务: Azure ({Config.SPEECH_REGION})")
+    else:
+        print(f"语音识别服务: 本地模拟后端 (延迟 {Config.LOCAL_ASR_LATENCY_MS}ms, 错误率 {Config.LOCAL_ASR_ERROR_RATE})")
 
-    # 执行批处理
-    results = run_batch_processing()
+    # 执行批处理（统计已增量汇总，不保留各文件的结果）
+    run_batch_processing(resume=args.resume, keep_results=False)